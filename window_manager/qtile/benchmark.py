@@ -0,0 +1,1179 @@
+# Offline benchmarks for the Qtile configuration.
+# Run this file directly, it doesn't need X session or Qtile installed:
+# python benchmark.py [benchmark name ...]
+#
+# The config.py is loaded with fake libqtile and dbus_next modules,
+# the fake Qtile/Group/Window objects fire the same hooks as Qtile,
+# and the external tools (amixer, xset, ...) are replaced by stub executables,
+# every result is printed as a JSON line.
+
+import asyncio, functools, html, itertools, json, os, shlex, shutil, statistics, subprocess, sys, tempfile, time, types, warnings
+from typing import Callable
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.py")
+ROUNDS = 200
+WINDOW_COUNTS = [1, 10, 50, 100, 500]  # The window counts of the window benchmarks.
+HOOKS: dict[str, list[Callable]] = {}
+
+# Output of the stub amixer, same as "amixer get -M Master" with PulseAudio.
+AMIXER_OUTPUT = """Simple mixer control 'Master',0
+  Capabilities: pvolume pswitch pswitch-joined
+  Playback channels: Front Left - Front Right
+  Limits: Playback 0 - 65536
+  Mono:
+  Front Left: Playback 26214 [40%] [on]
+  Front Right: Playback 26214 [40%] [on]
+"""
+# The control without mute switch.
+AMIXER_NO_SWITCH_OUTPUT = """Simple mixer control 'Master',0
+  Capabilities: volume volume-joined
+  Playback channels: Mono
+  Capture channels: Mono
+  Limits: 0 - 63
+  Mono: 30 [50%] [-10.00dB]
+"""
+# Recorded /proc/net/dev, used as the fixture of the network statistics.
+NET_DEV_FIXTURE = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: 32921408    4958    0    0    0     0          0         0 32921408    4958    0    0    0     0       0          0
+wlp2s0: 1873401266 1402311    0    0    0     0          0         0 98210431  612845    0    0    0     0       0          0
+docker0:       0       0    0    0    0     0          0         0        0       0    0    0    0     0       0          0
+  eth0:  486318      97    0    0    0     0          0         0    11543      98    0    0    0     0       0          0
+"""
+# The stub tools, every stub records its parent pid to the call log,
+# so the processes forked by shell can be counted.
+STUB_TOOLS = {
+    "amixer": f"cat <<'EOF'\n{AMIXER_OUTPUT}EOF",
+    "grep": 'exec {grep} "$@"',
+    "brightnessctl": 'echo "intel_backlight,backlight,1234,26%,4794"',
+    **{tool: "" for tool in ["systemctl", "xset", "fish", "dunstify", "kitty"]},
+}
+
+
+# The stub executables directory, prepend to PATH during benchmarks.
+class Stubs:
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix="qtile-benchmark-")
+        self.log = os.path.join(self.path, "calls.log")
+        real_grep = shutil.which("grep")
+        for tool, body in STUB_TOOLS.items():
+            stub = os.path.join(self.path, tool)
+            with open(stub, "w") as f:
+                f.write(f'#!/bin/sh\necho "$PPID {tool}" >> {self.log}\n')
+                f.write(body.format(grep=real_grep) + "\n")
+            os.chmod(stub, 0o755)
+        os.environ["PATH"] = f"{self.path}:{os.environ['PATH']}"
+        # Keep the session state of config.py in the stub directory.
+        os.environ["XDG_RUNTIME_DIR"] = self.path
+
+    # Count the stub processes forked by other processes (e.g. shell pipelines),
+    # the processes spawned by Python directly are counted by the audit hook.
+    def forked_calls(self) -> int:
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            parents = [line.split()[0] for line in f]
+        os.remove(self.log)
+        return sum(parent != str(os.getpid()) for parent in parents)
+
+
+# Count the processes spawned by Python.
+class Spawns:
+    count = 0
+
+    @staticmethod
+    def hook(event: str, _):
+        if event in ("subprocess.Popen", "os.system"):
+            Spawns.count += 1
+
+
+# Count the group layouts, the most expensive operation of the window handlers.
+class Layouts:
+    count = 0
+
+
+# Count the focus changes, every focus change fires the "client_focus" hook.
+class Focuses:
+    count = 0
+
+
+# Count the widget paints, the whole bar redraw paints every widget of the bar.
+class Draws:
+    count = 0
+
+    @staticmethod
+    def paint(widgets: int = 1):
+        Draws.count += widgets
+
+
+# Call the hook functions synchronously, same as Qtile fires hooks.
+def call_hooks(name: str, *args):
+    for func in HOOKS.get(name, []):
+        func(*args)
+
+
+# The fake layout, keep the windows in the group window order.
+class FakeLayout:
+    def __init__(self, group: "FakeGroup", floating: bool):
+        self.group, self.floating = group, floating
+
+    @property
+    def clients(self) -> list:
+        return [w for w in self.group.windows if w.floating == self.floating]
+
+    def focus_first(self, group=None):
+        clients = self.clients
+        return clients[0] if clients else None
+
+    def focus_last(self, group=None):
+        clients = self.clients
+        return clients[-1] if clients else None
+
+    def focus_next(self, w):
+        clients = self.clients
+        index = clients.index(w) + 1
+        return clients[index] if index < len(clients) else None
+
+    def focus_previous(self, w):
+        clients = self.clients
+        index = clients.index(w) - 1
+        return clients[index] if index >= 0 else None
+
+
+# The fake libqtile.group._Group.
+class FakeGroup:
+    def __init__(self, qtile: "FakeQtile", name: str):
+        self.qtile, self.name, self.windows, self.current_window = qtile, name, [], None
+        self.layout, self.floating_layout = FakeLayout(self, False), FakeLayout(
+            self, True
+        )
+
+    # Same as Qtile, the hook is fired before the window is floated by the float rules.
+    def add(self, w: "FakeWindow", focus: bool = True):
+        call_hooks("group_window_add", self, w)
+        self.windows.append(w)
+        w.group = self
+        if w.float_rule_matched:
+            w.floating = True
+        if focus:
+            self.focus(w)
+        else:
+            self.current_window = self.current_window or w
+            self.layout_all()
+
+    # Same as Qtile, focus the next window if the removed window has focus.
+    def remove(self, w: "FakeWindow"):
+        self.windows.remove(w)
+        w.group = None
+        if self.current_window is w:
+            self.current_window = None
+            self.focus(
+                self.layout.focus_first()
+                or self.floating_layout.focus_first(group=self)
+            )
+        else:
+            self.layout_all()
+
+    # Same as Qtile, the focus change also layouts the group.
+    def focus(self, w: "FakeWindow", warp: bool = True):
+        if w and w not in self.windows:
+            return
+        Focuses.count += 1
+        self.current_window = w
+        if w:
+            call_hooks("client_focus", w)
+        call_hooks("focus_change")
+        self.layout_all()
+
+    def layout_all(self, warp: bool = False):
+        Layouts.count += 1
+
+    def cmd_next_window(self):
+        pass
+
+
+# The fake libqtile.backend.base.Window.
+class FakeWindow:
+    def __init__(
+        self,
+        qtile: "FakeQtile",
+        wm_class: str,
+        floating: bool = False,
+        pid: int = 0,
+        wm_type: str = "normal",
+        name: str = "",
+    ):
+        self.qtile, self.wm_class, self.wm_type = qtile, wm_class, wm_type
+        self.pid, self.name = pid, name
+        # The window floats when it's added to group, same as matched by the float rules.
+        self.floating, self.float_rule_matched = False, floating
+        self.group, self.minimized, self.fullscreen = None, False, False
+        self.maximized = False
+        self.wid = id(self)
+
+    def get_pid(self) -> int:
+        return self.pid
+
+    # The instance and class name, same as WM_CLASS property.
+    def get_wm_class(self) -> list[str]:
+        return [self.wm_class.lower(), self.wm_class]
+
+    def get_wm_type(self) -> str:
+        return self.wm_type
+
+    def has_fixed_size(self) -> bool:
+        return False
+
+    def has_fixed_ratio(self) -> bool:
+        return False
+
+    def match(self, rule: "FakeMatch") -> bool:
+        return rule.compare(self)
+
+    def togroup(self, group_name: str, switch_group: bool = False):
+        group = self.qtile.groups_map[group_name]
+        if self.group is not group:
+            if self.group:
+                self.group.remove(self)
+            group.add(self)
+        if switch_group:
+            self.qtile.current_group = group
+
+    def cmd_set_position(self, x: int, y: int):
+        self.position = (x, y)
+
+    def cmd_set_size_floating(self, width: int, height: int):
+        self.size = (width, height)
+
+    def toggle_minimize(self):
+        self.minimized = not self.minimized
+        self.group.layout_all()
+
+    def cmd_bring_to_front(self):
+        pass
+
+    def cmd_center(self):
+        pass
+
+
+# The fake libqtile.config.Match, compare the properties same as Qtile.
+class FakeMatch:
+    def __init__(self, **rules):
+        self._rules = {
+            name: value for name, value in rules.items() if value is not None
+        }
+
+    def compare(self, client: FakeWindow) -> bool:
+        for name, value in self._rules.items():
+            if name == "func":
+                matched = value(client)
+            else:
+                properties = {
+                    "title": [client.name],
+                    "wm_class": client.get_wm_class(),
+                    "wm_type": [client.get_wm_type()],
+                }[name]
+                match = getattr(value, "match", lambda v: v == value)
+                matched = any(match(v) for v in properties)
+            if not matched:
+                return False
+        return True
+
+
+# The fake libqtile.core.manager.Qtile.
+class FakeQtile:
+    def __init__(self, group_names: list[str]):
+        self.groups = [FakeGroup(self, name) for name in group_names]
+        self.groups_map = {group.name: group for group in self.groups}
+        self.current_group = self.groups[0]
+        self.core = types.SimpleNamespace(flush=lambda: None)
+
+    @property
+    def current_window(self) -> FakeWindow:
+        return self.current_group.current_window
+
+    # Qtile double-forks the command without shell, the benchmark only starts it.
+    def cmd_spawn(self, cmd: str | list[str]) -> int:
+        args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+        return subprocess.Popen(args, start_new_session=True).pid
+
+    # Qtile ends the drag when the mouse button is released.
+    def process_button_release(self, button_code: int, modmask: int) -> bool:
+        return False
+
+
+# The fake dbus_next.Message and dbus_next.Variant, keep the arguments.
+class FakeMessage(types.SimpleNamespace):
+    pass
+
+
+class FakeVariant:
+    def __init__(self, signature: str, value):
+        self.signature, self.value = signature, value
+
+
+class FakeMessageType:
+    METHOD_RETURN, ERROR = "method_return", "error"
+
+
+# The fake notification daemon, check the Notify calls as the specification,
+# keep the valid notifications and the errors.
+class FakeNotificationDaemon:
+    DESTINATION = "org.freedesktop.Notifications"
+    PATH = "/org/freedesktop/Notifications"
+    SIGNATURE = "susssasa{sv}i"
+    HINTS = {"value": "i"}  # The signatures of the known hints.
+
+    notifications: list[list] = []
+    errors: list[str] = []
+
+    @staticmethod
+    def notify(message: FakeMessage) -> FakeMessage:
+        try:
+            assert message.destination == FakeNotificationDaemon.DESTINATION
+            assert message.interface == FakeNotificationDaemon.DESTINATION
+            assert message.path == FakeNotificationDaemon.PATH, message.path
+            assert message.member == "Notify", message.member
+            assert (
+                message.signature == FakeNotificationDaemon.SIGNATURE
+            ), message.signature
+            app, replace_id, icon, summary, body, actions, hints, timeout = message.body
+            assert all(isinstance(v, str) for v in [app, icon, summary, body])
+            assert isinstance(replace_id, int) and 0 <= replace_id < 2**32, replace_id
+            assert isinstance(actions, list) and all(
+                isinstance(a, str) for a in actions
+            )
+            for name, variant in hints.items():
+                assert variant.signature == FakeNotificationDaemon.HINTS[name], name
+                assert isinstance(variant.value, int), variant.value
+            assert isinstance(timeout, int), timeout
+        except (AssertionError, AttributeError, KeyError, ValueError) as e:
+            FakeNotificationDaemon.errors.append(f"{message}: {e!r}")
+            return FakeMessage(message_type=FakeMessageType.ERROR, body=[repr(e)])
+        FakeNotificationDaemon.notifications.append(message.body)
+        # The notification id, the same as the replace id if it's given.
+        notification_id = replace_id or len(FakeNotificationDaemon.notifications)
+        return FakeMessage(
+            message_type=FakeMessageType.METHOD_RETURN, body=[notification_id]
+        )
+
+
+# The fake dbus_next.aio.MessageBus connected to the fake notification daemon.
+class FakeMessageBus:
+    connections = 0  # The connections not closed.
+
+    def __init__(self):
+        self.connected = False
+
+    async def connect(self) -> "FakeMessageBus":
+        self.connected = True
+        FakeMessageBus.connections += 1
+        return self
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            FakeMessageBus.connections -= 1
+
+    async def call(self, message: FakeMessage) -> FakeMessage:
+        assert self.connected
+        return FakeNotificationDaemon.notify(message)
+
+
+# Fake the libqtile and dbus_next modules used by config.py.
+def fake_libqtile():
+    def module(name: str, **attrs) -> types.ModuleType:
+        m = types.ModuleType(name)
+        m.__dict__.update(attrs)
+        sys.modules[name] = m
+        return m
+
+    class Any:
+        def __init__(self, *args, **kwargs):
+            self.args, self.kwargs = args, kwargs
+
+        def __getattr__(self, _):
+            return Any()
+
+        def __call__(self, *args, **kwargs):
+            return Any()
+
+        def __getitem__(self, _):
+            return Any()
+
+    # The object returned by lazy.function, keep the function and its arguments.
+    class LazyCall:
+        def __init__(self, func: Callable, *args, **kwargs):
+            self.func, self.args, self.kwargs = func, args, kwargs
+
+        def __call__(self, *args, **kwargs):
+            return LazyCall(self.func, *args, **kwargs)
+
+        def run(self, qtile):
+            return self.func(qtile, *self.args, **self.kwargs)
+
+    class Lazy(Any):
+        def function(self, func: Callable) -> LazyCall:
+            return LazyCall(func)
+
+    class TextBox(Any):
+        def _configure(self, qtile, bar):
+            self.qtile, self.bar = qtile, bar
+
+        def finalize(self):
+            pass
+
+        def draw(self):
+            Draws.paint()
+
+        def update(self, text: str):
+            if text != self.text:
+                self.text = text
+                self.draw()
+
+    # Same as the WindowTabs widget of Qtile v0.21.
+    class WindowTabs(TextBox):
+        separator, selected, parse_text = " | ", ("<b>", "</b>"), None
+
+        def __init__(self, **config):
+            self.text = ""
+
+        def _configure(self, qtile, bar):
+            TextBox._configure(self, qtile, bar)
+            self.setup_hooks()
+
+        def setup_hooks(self):
+            for name in ["client_name_updated", "focus_change", "float_change"]:
+                HOOKS.setdefault(name, []).append(self.update)
+
+        # Same as Qtile, unsubscribing the hook not subscribed raises error.
+        def remove_hooks(self):
+            for name in ["client_name_updated", "focus_change", "float_change"]:
+                HOOKS[name].remove(self.update)
+
+        def finalize(self):
+            self.remove_hooks()
+            TextBox.finalize(self)
+
+        def add_callbacks(self, callbacks: dict):
+            pass
+
+        def update(self, *_):
+            group, names = self.bar.screen.group, []
+            for w in group.windows:
+                if w.minimized:
+                    state = "_ "
+                elif w.maximized:
+                    state = "[] "
+                else:
+                    state = "V " if w.floating else ""
+                task = html.escape(f"{state}{w.name or ' '}")
+                if w is group.current_window:
+                    task = task.join(self.selected)
+                names.append(task)
+            self.text = self.separator.join(names)
+            self.bar.draw()
+
+    # Same as the WindowCount widget of Qtile v0.21.
+    class WindowCount(TextBox):
+        def __init__(self, text_format: str = "{num}", **config):
+            self.text_format, self.text = text_format, ""
+
+        def _configure(self, qtile, bar):
+            TextBox._configure(self, qtile, bar)
+            self._setup_hooks()
+            self._wincount()
+
+        def _setup_hooks(self):
+            for name in ["client_killed", "client_managed", "setgroup"]:
+                HOOKS.setdefault(name, []).append(self._wincount)
+
+        def _wincount(self, *_):
+            self.update(self.text_format.format(num=len(self.bar.screen.group.windows)))
+
+    # Record the hook functions, the benchmarks fire the hooks manually.
+    class Subscribe:
+        def __getattr__(self, name: str):
+            def subscribe(func: Callable) -> Callable:
+                HOOKS.setdefault(name, []).append(func)
+                return func
+
+            return subscribe
+
+    # Same default float rules as Qtile.
+    class Floating(Any):
+        default_float_rules = [
+            *[
+                FakeMatch(wm_type=t)
+                for t in ["utility", "notification", "toolbar", "splash", "dialog"]
+            ],
+            *[
+                FakeMatch(wm_class=c)
+                for c in [
+                    "file_progress",
+                    "confirm",
+                    "dialog",
+                    "download",
+                    "error",
+                    "notification",
+                    "splash",
+                    "toolbar",
+                ]
+            ],
+            FakeMatch(func=lambda c: c.has_fixed_size()),
+            FakeMatch(func=lambda c: c.has_fixed_ratio()),
+        ]
+
+    logger = types.SimpleNamespace(**{n: lambda *_: None for n in ["warn", "warning"]})
+    module("libqtile", qtile=None)
+    module("libqtile.pangocffi", markup_escape_text=html.escape)
+    module("libqtile.bar", Bar=Any, Gap=Any)
+    module("libqtile.layout", Floating=Floating, __getattr__=lambda _: Any)
+    module(
+        "libqtile.widget",
+        TextBox=TextBox,
+        WindowTabs=WindowTabs,
+        WindowCount=WindowCount,
+        __getattr__=lambda _: Any,
+    )
+    module("libqtile.hook", subscribe=Subscribe())
+    module(
+        "libqtile.config",
+        **{
+            n: Any
+            for n in [
+                "Click",
+                "Drag",
+                "Group",
+                "Key",
+                "Screen",
+                "ScratchPad",
+                "DropDown",
+            ]
+        },
+    )
+    sys.modules["libqtile.config"].Match = FakeMatch
+    module("libqtile.backend")
+    module("libqtile.backend.base", Window=FakeWindow)
+    module("libqtile.core")
+    module("libqtile.core.manager", Qtile=FakeQtile)
+    module("libqtile.lazy", lazy=Lazy())
+    module("libqtile.log_utils", logger=logger)
+    module("libqtile.utils", create_task=asyncio.get_event_loop().create_task)
+    module(
+        "dbus_next",
+        Message=FakeMessage,
+        MessageType=FakeMessageType,
+        Variant=FakeVariant,
+    )
+    module("dbus_next.aio", MessageBus=FakeMessageBus)
+
+
+def load_config() -> dict:
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    fake_libqtile()
+    config = exec_config()
+    fire_hook("startup")
+    return config
+
+
+# Execute config.py, same as Qtile loads the config file.
+def exec_config() -> dict:
+    config = types.ModuleType("config")
+    config.__file__ = CONFIG_PATH
+    with open(CONFIG_PATH) as f:
+        exec(compile(f.read(), CONFIG_PATH, "exec"), config.__dict__)
+    return config.__dict__
+
+
+def fire_hook(name: str, *args):
+    call_hooks(name, *args)
+    drain()
+
+
+# Run the due timers, then wait the background tasks started by them.
+def drain():
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(asyncio.sleep(0))
+    while tasks := asyncio.all_tasks(loop):
+        loop.run_until_complete(asyncio.wait(tasks))
+
+
+def shell(command: str) -> str:
+    return subprocess.check_output(command, shell=True, text=True).strip()
+
+
+# Run the coroutine in the benchmark event loop.
+def run_async(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+# Press the key binding, wait the background tasks started by the handler.
+def press(handler, qtile: FakeQtile):
+    # Qtile calls the key binding handlers in its event loop.
+    async def call():
+        handler.run(qtile)
+
+    run_async(call())
+    drain()
+
+
+# Run the function repeatedly, report the latency, the processes and the layouts per call.
+# The setup function runs before every call, and isn't measured.
+def measure(
+    stubs: Stubs,
+    name: str,
+    variant: str,
+    func: Callable,
+    rounds: int = ROUNDS,
+    setup: Callable = None,
+    **fields,
+):
+    stubs.forked_calls()  # Clear the calls before measure.
+    spawns, layouts, focuses, draws, latencies = 0, 0, 0, 0, []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        Spawns.count, Layouts.count, Focuses.count, Draws.count = 0, 0, 0, 0
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+        spawns, layouts = spawns + Spawns.count, layouts + Layouts.count
+        focuses, draws = focuses + Focuses.count, draws + Draws.count
+    latencies.sort()
+    print(
+        json.dumps(
+            {
+                "benchmark": name,
+                "variant": variant,
+                **fields,
+                "rounds": rounds,
+                "forks_per_call": (spawns + stubs.forked_calls()) / rounds,
+                "layouts_per_call": layouts / rounds,
+                "focuses_per_call": focuses / rounds,
+                "draws_per_call": draws / rounds,
+                "mean_ms": round(statistics.mean(latencies), 3),
+                "p50_ms": round(latencies[len(latencies) // 2], 3),
+                "p99_ms": round(latencies[int(len(latencies) * 0.99)], 3),
+            }
+        )
+    )
+
+
+# Create the fake session with windows in the first group,
+# the "window" function creates the i-th window.
+def open_session(
+    config: dict, count: int, window: Callable[[FakeQtile, int], FakeWindow]
+) -> FakeQtile:
+    qtile = FakeQtile(["1", "2", config["Application"].Terminal.GROUP_NAME])
+    sys.modules["libqtile"].qtile = qtile  # Set by Qtile when it starts.
+    for i in range(count):
+        qtile.groups_map["1"].add(window(qtile, i), focus=False)
+    return qtile
+
+
+# Kill all windows, so the window indexes of config.py won't leak to the next session.
+def close_session(qtile: FakeQtile):
+    for group in qtile.groups:
+        for w in list(group.windows):
+            group.windows.remove(w)
+            call_hooks("client_killed", w)
+    sys.modules["libqtile"].qtile = None
+
+
+# Compare the mixer state reading: two shell pipelines vs one amixer call.
+def benchmark_volume_read(config: dict, stubs: Stubs):
+    VolumeControl = config["VolumeControl"]
+    State = VolumeControl.State
+    assert VolumeControl.parse_state(AMIXER_OUTPUT) == State(40, False)
+    assert VolumeControl.parse_state(AMIXER_NO_SWITCH_OUTPUT) == State(50, False)
+    assert VolumeControl.parse_state("amixer: Unable to find simple control") is None
+
+    # The previous commands, use "grep -m1" to only read the first channel.
+    def legacy_read():
+        volume = int(shell("amixer get -M Master | grep -Pom1 '\\d+(?=%)'"))
+        mute = shell("amixer get -M Master | grep -Pom1 '\\[(o|n|f)+\\]'")
+        return volume, mute == "[off]"
+
+    measure(stubs, "volume_read", "legacy_shell_pipelines", legacy_read)
+    measure(
+        stubs,
+        "volume_read",
+        "single_query",
+        lambda: run_async(VolumeControl.read_state()),
+    )
+
+
+# The key binding handlers and hooks which walk the windows of group.
+def benchmark_window_handlers(config: dict, stubs: Stubs):
+    terminal_group = config["Application"].Terminal.GROUP_NAME
+
+    def run(handler: str) -> Callable:
+        return lambda: config[handler].run(qtile)
+
+    def focus_normal_window():
+        windows = qtile.groups_map["1"].windows
+        call_hooks("client_focus", next(w for w in windows if not w.floating))
+
+    # Move the hidden terminals back to the first group.
+    def show_terminals():
+        for w in list(qtile.groups_map[terminal_group].windows):
+            w.togroup("1")
+
+    # Minimize one window each round, same as the "toggle_window" handler.
+    def minimize_window(windows: itertools.cycle):
+        w = next(windows)
+        if not w.minimized:
+            w.toggle_minimize()
+            config["MinimizedStack"].push(w.group.name, w)
+
+    for count in WINDOW_COUNTS:
+        variant = f"windows={count}"
+        # Every fourth window is floating terminal, focus cycles between the terminals.
+        qtile = open_session(
+            config,
+            count,
+            lambda q, i: (
+                FakeWindow(q, "kitty", True) if i % 4 == 0 else FakeWindow(q, "firefox")
+            ),
+        )
+        measure(
+            stubs,
+            "open_terminal_by_need",
+            variant,
+            run("open_terminal_by_need"),
+            windows=count,
+        )
+        close_session(qtile)
+
+        # Every other window is minimized.
+        qtile = open_session(config, count, lambda q, i: FakeWindow(q, "firefox"))
+        for w in qtile.groups_map["1"].windows[1::2]:
+            w.toggle_minimize()
+        measure(stubs, "next_window", variant, run("next_window"), windows=count)
+        close_session(qtile)
+
+        # Every tenth window is floating terminal, the first window is normal window.
+        qtile = open_session(
+            config,
+            count,
+            lambda q, i: (
+                FakeWindow(q, "kitty", True)
+                if i % 10 == 1
+                else FakeWindow(q, "firefox")
+            ),
+        )
+        measure(
+            stubs,
+            "hide_floating_terminals",
+            variant,
+            run("hide_floating_terminals"),
+            setup=show_terminals,
+            windows=count,
+        )
+        measure(
+            stubs,
+            "client_focus",
+            f"{variant},floating_terminals",
+            focus_normal_window,
+            setup=show_terminals,
+            windows=count,
+        )
+        close_session(qtile)
+
+        qtile = open_session(config, count, lambda q, i: FakeWindow(q, "firefox"))
+        measure(
+            stubs,
+            "client_focus",
+            f"{variant},no_floating_terminal",
+            focus_normal_window,
+            windows=count,
+        )
+        windows = itertools.cycle(qtile.groups_map["1"].windows)
+        measure(
+            stubs,
+            "restore_minimized_window",
+            variant,
+            run("restore_minimized_window"),
+            setup=lambda: minimize_window(windows),
+            windows=count,
+        )
+        close_session(qtile)
+
+
+# Hide the floating terminals of the current group, move them one by one vs by one batch.
+# The tiled window keeps focus, otherwise the "client_focus" hook hides the terminals
+# when the focus moves from the first hidden terminal to the tiled window.
+def benchmark_move_terminals(config: dict, stubs: Stubs):
+    terminal_group = config["Application"].Terminal.GROUP_NAME
+    normal_windows = 20
+
+    # The previous implementation of "hide_floating_terminals".
+    def move_one_by_one():
+        terminals = config["TerminalIndex"].floating_terminals(qtile, "1")
+        terminals.reverse()
+        [w.togroup(terminal_group) for w in terminals]
+
+    def show_terminals():
+        group = qtile.groups_map["1"]
+        for w in list(qtile.groups_map[terminal_group].windows):
+            group.add(w, focus=False)
+        qtile.groups_map[terminal_group].windows.clear()
+        group.current_window = group.windows[0]
+
+    for count in [1, 5, 10, 50, 100]:
+        qtile = open_session(
+            config,
+            normal_windows + count,
+            lambda q, i: (
+                FakeWindow(q, "firefox")
+                if i < normal_windows
+                else FakeWindow(q, "kitty", True)
+            ),
+        )
+        variant = f"terminals={count}"
+        for name, func in [
+            ("one_by_one", move_one_by_one),
+            ("batched", lambda: config["hide_floating_terminals"].run(qtile)),
+        ]:
+            measure(
+                stubs,
+                "move_terminals",
+                f"{variant},{name}",
+                func,
+                setup=show_terminals,
+                terminals=count,
+            )
+        close_session(qtile)
+
+
+# Check the float rules for a burst of new windows (e.g. session restore, browser popups),
+# check every rule vs the compiled rules (the cache is cold at the start of every burst).
+def benchmark_float_rules(config: dict, stubs: Stubs):
+    FloatingLayout = config["FloatingLayout"]
+    rules = config["floating_layout"].kwargs["float_rules"]
+    qtile = FakeQtile(["1"])
+    # The window classes and types of the burst.
+    kinds = [
+        ("Firefox", "normal"),
+        ("Firefox", "dialog"),
+        ("kitty", "normal"),
+        ("Thunderbird", "normal"),
+        ("Steam", "splash"),
+        ("Gimp", "utility"),
+        ("code", "normal"),
+        ("Download", "normal"),
+    ]
+    for count in [10, 100, 500]:
+        windows = [
+            FakeWindow(qtile, *kinds[i % len(kinds)], name=f"window {i}")
+            for i in range(count)
+        ]
+        linear = [any(w.match(rule) for rule in rules) for w in windows]
+        compiled = FloatingLayout(float_rules=rules)
+        assert [compiled.match(w) for w in windows] == linear
+        layouts = []
+        measure(
+            stubs,
+            "float_rules",
+            f"windows={count},every_rule",
+            lambda: [any(w.match(rule) for rule in rules) for w in windows],
+            windows=count,
+        )
+        measure(
+            stubs,
+            "float_rules",
+            f"windows={count},compiled",
+            lambda: [layouts[-1].match(w) for w in windows],
+            setup=lambda: layouts.append(FloatingLayout(float_rules=rules)),
+            windows=count,
+        )
+
+
+# Open a new terminal by "mod+Return" when there is no terminal:
+# the shell command vs the direct exec vs showing the warm terminal.
+def benchmark_terminal_launch(config: dict, stubs: Stubs):
+    Terminal = config["Application"].Terminal
+    qtile = open_session(config, 0, None)
+
+    def open_terminal():
+        press(config["open_terminal_by_need"], qtile)
+
+    # The previous command started by os.system().
+    measure(
+        stubs,
+        "terminal_launch",
+        "legacy_shell",
+        lambda: os.system("env GLFW_IM_MODULE=ibus kitty  &"),
+    )
+    measure(stubs, "terminal_launch", "direct_exec", open_terminal)
+
+    # The warm terminal started by the last call is mapped before the next key press.
+    def map_warm_terminal():
+        w = FakeWindow(qtile, "kitty", True, Terminal._Terminal__warm_pid)
+        call_hooks("client_new", w)
+        if not w.group:  # The first round, no warm terminal started.
+            w.togroup(Terminal.GROUP_NAME)
+        qtile.current_group.current_window = None
+
+    Terminal.KEEP_WARM = True
+    try:
+        measure(
+            stubs,
+            "terminal_launch",
+            "warm_terminal",
+            open_terminal,
+            setup=map_warm_terminal,
+        )
+    finally:
+        Terminal.KEEP_WARM = False
+        close_session(qtile)
+
+
+# The volume and brightness key binding handlers,
+# include the deferred commands and notifications they started.
+def benchmark_control_handlers(config: dict, stubs: Stubs):
+    VolumeControl, BrightnessControl = (
+        config["VolumeControl"],
+        config["BrightnessControl"],
+    )
+    Notification = config["Notification"]
+    FakeNotificationDaemon.notifications.clear()
+    # Apply the accumulated changes immediately, measure one key press per round.
+    for accumulator in [
+        VolumeControl._VolumeControl__volume_changes,
+        BrightnessControl._BrightnessControl__brightness_changes,
+    ]:
+        accumulator.window = accumulator.max_delay = 0
+
+    def run(handler, *args) -> Callable:
+        return lambda: press(handler(*args), None)
+
+    measure(stubs, "change_volume", "amixer", run(VolumeControl.change_volume, 5))
+    measure(stubs, "change_mute", "amixer", run(VolumeControl.change_mute))
+
+    # The backlight is detected on the first change, detect again after the path changed.
+    BrightnessControl.SYSFS_PATH = os.path.join(stubs.path, "backlight")
+    BrightnessControl.detect.cache_clear()
+    measure(
+        stubs, "change_brightness", "tool", run(BrightnessControl.change_brightness, 5)
+    )
+    # The fake sysfs backlight device.
+    device = os.path.join(BrightnessControl.SYSFS_PATH, "intel_backlight")
+    os.makedirs(device)
+    for file, value in [("brightness", 2400), ("max_brightness", 4800)]:
+        with open(os.path.join(device, file), "w") as f:
+            f.write(str(value))
+    BrightnessControl.detect.cache_clear()
+    measure(
+        stubs, "change_brightness", "sysfs", run(BrightnessControl.change_brightness, 5)
+    )
+
+    # Every key press above sent a notification to the fake daemon by one connection.
+    assert not FakeNotificationDaemon.errors, FakeNotificationDaemon.errors
+    assert len(FakeNotificationDaemon.notifications) == ROUNDS * 4
+    assert FakeMessageBus.connections == 1, FakeMessageBus.connections
+    Notification.disconnect()
+    assert FakeMessageBus.connections == 0, FakeMessageBus.connections
+    # Without dbus-next, fall back to dunstify.
+    config["MessageBus"] = None
+    try:
+        measure(
+            stubs,
+            "change_volume",
+            "amixer,dunstify",
+            run(VolumeControl.change_volume, 5),
+        )
+    finally:
+        config["MessageBus"] = FakeMessageBus
+
+
+# Read the network statistics from the fixture for the widgets of three screens,
+# the shared reading vs every widget reads and parses /proc/net/dev by itself.
+def benchmark_net_stats(config: dict, stubs: Stubs):
+    NetStats, screens = config["NetStats"], 3
+    NetStats.PATH = os.path.join(stubs.path, "net_dev")
+    with open(NetStats.PATH, "w") as f:
+        f.write(NET_DEV_FIXTURE)
+    counters = NetStats.parse(NET_DEV_FIXTURE.encode())
+    assert counters["wlp2s0"] == (1873401266, 98210431), counters
+    assert counters["eth0"] == (486318, 11543), counters
+
+    def read_by_widgets():
+        for _ in range(screens):
+            with open(NetStats.PATH, "rb") as f:
+                NetStats.parse(f.read())
+
+    measure(stubs, "net_stats", "read_by_every_widget", read_by_widgets)
+    listeners = [lambda rates: rates[NetStats.TOTAL] for _ in range(screens)]
+    for listener in listeners:
+        NetStats.subscribe(listener)
+    measure(stubs, "net_stats", "shared_read", NetStats.tick)
+    for listener in listeners:
+        NetStats.unsubscribe(listener)
+    assert NetStats._NetStats__fd is None  # Closed by the last listener.
+
+
+# Drag a floating window by a 1000Hz mouse, apply every motion event vs coalesce to the frame rate.
+# The events and the applied geometries are counted by real-time drags,
+# then the handler is measured per motion event.
+def benchmark_drag(config: dict, stubs: Stubs):
+    DragThrottle, drag_window = config["DragThrottle"], config["drag_window"]
+    qtile = FakeQtile(["1"])
+    w = FakeWindow(qtile, "Gimp", floating=True)
+    qtile.groups_map["1"].add(w)
+    events, drags = [(i, i // 2) for i in range(200)], 3
+
+    async def drag():
+        for x, y in events:
+            drag_window("cmd_set_position", x, y).run(qtile)
+            await asyncio.sleep(0.001)
+        qtile.process_button_release(1, 0)
+
+    for frame_rate in [0, 60, 144]:
+        DragThrottle.FRAME_RATE = frame_rate
+        before = DragThrottle.stats()
+        for _ in range(drags):
+            run_async(drag())
+            assert w.position == events[-1], w.position  # Committed on release.
+        after = DragThrottle.stats()
+        measure(
+            stubs,
+            "drag",
+            f"frame_rate={frame_rate}",
+            lambda: press(drag_window("cmd_set_position", 1, 1), qtile),
+            events_per_drag=(after["received"] - before["received"]) / drags,
+            applied_per_drag=(after["applied"] - before["applied"]) / drags,
+        )
+        DragThrottle.commit()
+
+
+# Two screens with the window count and tabs widgets, the terminal on the first screen
+# updates its title every 10ms (e.g. progress output) and the focus changes twice meanwhile:
+# the Qtile widgets vs the widgets driven by the shared window state.
+def benchmark_bar_redraw(config: dict, stubs: Stubs):
+    WindowState, widgets = config["WindowState"], sys.modules["libqtile.widget"]
+    qtile = open_session(config, 10, lambda q, i: FakeWindow(q, "App", name=f"app {i}"))
+    for i in range(5):
+        qtile.groups_map["2"].add(FakeWindow(qtile, "App", name=f"other {i}"))
+    terminal = qtile.groups_map["1"].windows[1]
+    titles = [f"make [{i}%]" for i in range(50)]
+
+    async def burst():
+        for i, title in enumerate(titles):
+            terminal.name = title
+            call_hooks("client_name_updated", terminal)
+            if i % 25 == 12:
+                group = qtile.groups_map["1"]
+                group.focus(group.windows[i % len(group.windows)])
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(WindowState.TITLE_DELAY)  # Wait the delayed titles shown.
+
+    for variant, build_widgets in [
+        ("qtile_widgets", lambda: [widgets.WindowCount(), widgets.WindowTabs()]),
+        ("window_state", lambda: [WindowState.Count(), WindowState.Tabs()]),
+    ]:
+        hooks, bars = {name: list(funcs) for name, funcs in HOOKS.items()}, []
+        for group_name in ["1", "2"]:
+            bar = types.SimpleNamespace(
+                screen=types.SimpleNamespace(group=qtile.groups_map[group_name]),
+                widgets=build_widgets(),
+            )
+            # The whole bar redraw paints every widget.
+            bar.draw = functools.partial(Draws.paint, len(bar.widgets))
+            for w in bar.widgets:
+                w._configure(qtile, bar)
+            bars.append(bar)
+        try:
+            measure(
+                stubs,
+                "bar_redraw",
+                variant,
+                lambda: run_async(burst()),
+                rounds=3,
+                title_changes=len(titles),
+            )
+            # The last title is shown.
+            assert bars[0].widgets[1].text.count(titles[-1]) == 1
+        finally:
+            for bar in bars:
+                for w in bar.widgets:
+                    w.finalize()
+            HOOKS.clear()
+            HOOKS.update(hooks)
+
+
+# Fire the "client_focus" hook without and with the trace recording,
+# then dump the full trace buffer.
+def benchmark_event_trace(config: dict, stubs: Stubs):
+    Trace = config["Trace"]
+    qtile = open_session(config, 10, lambda q, i: FakeWindow(q, "App", name=f"app {i}"))
+    windows = qtile.groups_map["1"].windows
+    focus = lambda: call_hooks("client_focus", windows[0])
+    try:
+        for enabled in [False, True]:
+            Trace.ENABLED = enabled
+            measure(stubs, "event_trace", f"client_focus,trace={enabled}", focus)
+    finally:
+        Trace.ENABLED = True
+    for _ in range(Trace.SIZE):
+        focus()
+    path = os.path.join(stubs.path, "trace.json")
+    measure(
+        stubs,
+        "event_trace",
+        "dump",
+        lambda: Trace.dump(path),
+        rounds=ROUNDS // 10,
+        events=Trace.SIZE,
+    )
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == Trace.SIZE, len(events)
+    assert events[-1]["args"] == {"wid": windows[0].wid, "group": "1"}, events[-1]
+    assert all(a["ts"] <= b["ts"] for a, b in zip(events, events[1:]))
+
+
+# Load config.py as the first start and as the reload of the same session.
+def benchmark_config_load(config: dict, stubs: Stubs):
+    hooks = {name: list(funcs) for name, funcs in HOOKS.items()}
+    # The first start schedules the startup commands, they never run in this benchmark.
+    warnings.simplefilter("ignore", RuntimeWarning)
+    try:
+        measure(
+            stubs,
+            "config_load",
+            "first_start",
+            exec_config,
+            rounds=ROUNDS // 10,
+            setup=lambda: os.remove(config["Session"].PATH),
+        )
+        measure(stubs, "config_load", "reload", exec_config, rounds=ROUNDS // 10)
+    finally:
+        HOOKS.clear()
+        HOOKS.update(hooks)  # Drop the hooks subscribed by the loaded configs.
+
+
+BENCHMARKS = {
+    "volume_read": benchmark_volume_read,
+    "window_handlers": benchmark_window_handlers,
+    "control_handlers": benchmark_control_handlers,
+    "terminal_launch": benchmark_terminal_launch,
+    "move_terminals": benchmark_move_terminals,
+    "float_rules": benchmark_float_rules,
+    "net_stats": benchmark_net_stats,
+    "drag": benchmark_drag,
+    "bar_redraw": benchmark_bar_redraw,
+    "event_trace": benchmark_event_trace,
+    "config_load": benchmark_config_load,
+}
+
+if __name__ == "__main__":
+    stubs = Stubs()
+    try:
+        config = load_config()
+        sys.addaudithook(Spawns.hook)
+        for name in sys.argv[1:] or BENCHMARKS:
+            BENCHMARKS[name](config, stubs)
+    finally:
+        shutil.rmtree(stubs.path)
@@ -3,17 +3,36 @@
 # Qtile will log in the path ~/.local/share/qtile/qtile.log.
 
 # Import librarys.
-from libqtile import bar, layout, widget, hook
+import time
+
+# The start of the startup profile, see Session.profile().
+load_start = time.perf_counter()
+
+import libqtile
+from libqtile import bar, layout, widget, hook, pangocffi
 from libqtile.config import Click, Drag, Group, Key, Match, Screen, ScratchPad, DropDown
 from libqtile.backend.base import Window
 from libqtile.core.manager import Qtile
 from libqtile.lazy import lazy
 from libqtile.log_utils import logger
+from libqtile.utils import create_task
 
-import os, subprocess
-from typing import Callable
+import asyncio, collections, contextlib, contextvars, functools, glob, json, os, re, shlex, shutil
+from typing import Callable, Coroutine, NamedTuple
 from enum import Enum, auto
 
+try:
+    # The dbus-next is an optional dependency of Qtile.
+    from dbus_next import Message, MessageType, Variant
+    from dbus_next.aio import MessageBus
+except ImportError:
+    MessageBus = None  # Fall back to dunstify.
+try:
+    # The xcffib is provided by Qtile X11 backend.
+    import xcffib, xcffib.dpms, xcffib.randr, xcffib.screensaver, xcffib.xproto
+except ImportError:
+    xcffib = None
+
 
 # Qtile most useful API:
 # qtile.current_window
@@ -39,6 +58,87 @@ from enum import Enum, auto
 logger.warn("Qtile start ...")
 
 
+# Qtile re-executes this file on every config reload (and restart),
+# the session state is persisted in the runtime directory to tell the first start from reloads,
+# so the one-time side effects run only once, and the expensive values are reused.
+class Session:
+    PATH = os.path.join(
+        os.environ.get("XDG_RUNTIME_DIR") or f"/tmp/qtile-{os.getuid()}",
+        "qtile-session.json",
+    )
+
+    first_start = True
+    __state: dict = {}
+    __sections: list[tuple[str, float]] = []  # The section names and their costs.
+    __load_start = __section_start = load_start
+
+    # The pid and start time identify the Qtile process, the pid may be reused.
+    def __process_id() -> str:
+        try:
+            with open("/proc/self/stat") as f:
+                start_time = f.read().rsplit(")", 1)[1].split()[19]
+        except (OSError, IndexError):
+            start_time = None
+        return f"{os.getpid()}/{start_time}"
+
+    @staticmethod
+    def load():
+        try:
+            with open(Session.PATH) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        process = Session.__process_id()
+        Session.first_start = state.get("process") != process
+        Session.__state = {"process": process} if Session.first_start else state
+        if Session.first_start:
+            Session.__save()
+
+    def __save():
+        try:
+            os.makedirs(os.path.dirname(Session.PATH), exist_ok=True)
+            with open(Session.PATH, "w") as f:
+                json.dump(Session.__state, f)
+        except OSError as e:
+            logger.warn(f"Save session state failed: {e}")
+
+    # Get the value computed in this session, compute and save it if not found.
+    @staticmethod
+    def cached(key: str, compute: Callable):
+        if key not in Session.__state:
+            Session.__state[key] = compute()
+            Session.__save()
+        return Session.__state[key]
+
+    @staticmethod
+    def forget(key: str):
+        if Session.__state.pop(key, None) is not None:
+            Session.__save()
+
+    # Record the cost of the config section since the previous section ends.
+    @staticmethod
+    def profile(section: str):
+        now = time.perf_counter()
+        Session.__sections.append((section, now - Session.__section_start))
+        Session.__section_start = now
+
+    # Log the duration of loading this file and the cost of each section,
+    # called at the end of the config, only one log is written.
+    @staticmethod
+    def loaded():
+        duration = (time.perf_counter() - Session.__load_start) * 1000
+        state = "first start" if Session.first_start else "reload"
+        sections = ", ".join(
+            f"{section} {cost * 1000:.1f}ms" for section, cost in Session.__sections
+        )
+        logger.warn(f"Config loaded in {duration:.0f}ms ({state}): {sections}")
+
+
+Session.profile("imports")
+Session.load()
+Session.profile("session")
+
+
 # Qtile pre-define config variables
 follow_mouse_focus = False
 auto_fullscreen = True
@@ -58,15 +158,16 @@ once_cmds = [
     # "fcitx5", # Fcitx5 is provided by systemd service.
     # "clash-premium",  # Clash proxy is provided by systemd service.
 ]
+# In NixOS PulseAudio should restart during window manager startup, otherwise command can't get PulseAudio volume correctly.
+# The volume widget waits this command finished.
+start_pulseaudio = "systemctl --user start pulseaudio"
+# The normal commands run concurrently in background after Qtile started.
 normal_cmds = [
-    "systemctl --user start pulseaudio",  # In NixOS PulseAudio should restart during window manager startup, otherwise command can't get PulseAudio volume correctly.
+    start_pulseaudio,
     "xset +dpms",
     "xset dpms 600 900 1800",
     "xset s 600",
 ]
-run_once = lambda cmd: os.system(f"fish -c 'pgrep -u $USER -x {cmd}; or {cmd} &'")
-[run_once(cmd) for cmd in once_cmds]
-[os.system(cmd) for cmd in normal_cmds]
 
 
 # Define the Notification Types.
@@ -77,6 +178,89 @@ class NotificationType(Enum):
     TAKE_SCREENSHOT = auto()
 
 
+# Deliver the notifications in background, Qtile event loop never waits for the notification daemon.
+class Notification:
+    APP_NAME = "qtile"
+    BUS_NAME = INTERFACE = "org.freedesktop.Notifications"
+    PATH = "/org/freedesktop/Notifications"
+
+    # Notifications wait for delivery, keyed by the replace id,
+    # so only the latest notification of each type will be sent.
+    __pending: dict[object, tuple] = {}
+    __sender: asyncio.Task = None
+    __bus: "MessageBus" = None  # The persistent D-Bus connection.
+
+    @staticmethod
+    def send(
+        title: str,
+        content: str,
+        replace_id: NotificationType = None,
+        percent_value: int = None,
+    ):
+        # Never coalesce the notifications without replace id.
+        key = replace_id or object()
+        Notification.__pending[key] = (title, content, replace_id, percent_value)
+        if not Notification.__sender:
+            Notification.__sender = create_task(Notification.__send_pending())
+
+    async def __send_pending():
+        try:
+            while Notification.__pending:
+                key = next(iter(Notification.__pending))
+                notification = Notification.__pending.pop(key)
+                if MessageBus:
+                    try:
+                        await Notification.__notify_by_dbus(*notification)
+                        continue
+                    except Exception as e:
+                        logger.warn(f"Send notification by D-Bus failed: {e}")
+                await Notification.__notify_by_dunstify(*notification)
+        finally:
+            Notification.__sender = None
+
+    async def __notify_by_dbus(
+        title: str, content: str, replace_id: NotificationType, percent_value: int
+    ):
+        if not Notification.__bus or not Notification.__bus.connected:
+            Notification.__bus = await MessageBus().connect()
+        hints = {"value": Variant("i", percent_value)} if percent_value else {}
+        reply = await Notification.__bus.call(
+            Message(
+                destination=Notification.BUS_NAME,
+                path=Notification.PATH,
+                interface=Notification.INTERFACE,
+                member="Notify",
+                signature="susssasa{sv}i",
+                body=[
+                    Notification.APP_NAME,
+                    replace_id.value if replace_id else 0,
+                    "",  # Application icon.
+                    title,
+                    content,
+                    [],  # Actions.
+                    hints,
+                    -1,  # Use the default expire timeout of notification daemon.
+                ],
+            )
+        )
+        if reply.message_type == MessageType.ERROR:
+            raise RuntimeError(reply.body)
+
+    # Close the D-Bus connection, the next notification reconnects.
+    @staticmethod
+    def disconnect():
+        if Notification.__bus:
+            Notification.__bus.disconnect()
+            Notification.__bus = None
+
+    async def __notify_by_dunstify(
+        title: str, content: str, replace_id: NotificationType, percent_value: int
+    ):
+        replace = ["-r", str(replace_id.value)] if replace_id else []
+        percent = ["-h", f"int:value:{percent_value}"] if percent_value else []
+        await Command.run(["dunstify", title, content, *replace, *percent])
+
+
 # Send the notification.
 def send_notification(
     title: str,
@@ -84,18 +268,385 @@ def send_notification(
     replace_id: NotificationType = None,
     percent_value: int = None,
 ):
-    replace = f"-r {replace_id.value}" if replace_id else ""
-    percent = f"-h int:value:{percent_value}" if percent_value else ""
-    os.system(f"dunstify '{title}' '{content}' {replace} {percent}")
+    Notification.send(title, content, replace_id, percent_value)
+
+
+# Trace the calls of the measured functions (see Latency) in a preallocated ring buffer,
+# instead of logging the window operations on the hot path,
+# every call only stores a tuple: function name, window id, group name, start time, duration.
+# Dump the recent events by command: qtile cmd-obj -o cmd -f dump_trace
+# The dump is in the Chrome trace event format, open it by Perfetto (ui.perfetto.dev).
+class Trace:
+    ENABLED = True
+    SIZE = 4096  # The count of the recent events to keep.
+    PATH = os.path.expanduser("~/.local/share/qtile/trace.json")
+
+    __events: list[tuple] = [None] * SIZE
+    __next = 0  # The count of all recorded events.
+
+    @staticmethod
+    def record(name: str, args: tuple, start: float, duration: float):
+        w = args[0] if args else None
+        if isinstance(w, Qtile):
+            w = w.current_window  # The key binding handlers.
+        elif not isinstance(w, Window):
+            # The hooks with the window as the second argument, e.g. group_window_add(group, w).
+            w = args[1] if len(args) > 1 and isinstance(args[1], Window) else None
+        group = w and w.group
+        Trace.__events[Trace.__next % Trace.SIZE] = (
+            name,
+            w and w.wid,
+            group and group.name,
+            start,
+            duration,
+        )
+        Trace.__next += 1
+
+    # Get the recorded events from the oldest.
+    @staticmethod
+    def events() -> list[tuple]:
+        index = Trace.__next % Trace.SIZE
+        events = Trace.__events[index:] + Trace.__events[:index]
+        return [event for event in events if event]
+
+    # Write the events to the file, return the path.
+    @staticmethod
+    def dump(path: str = None) -> str:
+        path = path or Trace.PATH
+        # The times are recorded by the monotonic perf_counter(), keep the offset to the wall clock.
+        wall_offset = time.time() - time.perf_counter()
+        trace = {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",  # Complete event.
+                    "ts": start * 1e6,  # Microseconds.
+                    "dur": duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": 0,
+                    "args": {"wid": wid, "group": group},
+                }
+                for name, wid, group, start, duration in Trace.events()
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "wall_offset": wall_offset,
+                "dropped": max(Trace.__next - Trace.SIZE, 0),
+            },
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(trace, f)
+        return path
+
+    # Add the command to Qtile.
+    Qtile.cmd_dump_trace = lambda _, path=None: Trace.dump(path)
+
+
+# Measure the hot path functions (key binding handlers and hooks),
+# record the call count, latency percentiles and subprocess count of each function,
+# and trace the calls when Trace is enabled.
+# Query the statistics by command: qtile cmd-obj -o cmd -f handler_stats
+class Latency:
+    ENABLED = True  # When disabled, the measured functions only check this flag.
+    SAMPLES = 1024  # Keep the latency of recent calls to caculate the percentiles.
+    REPORT_INTERVAL = 1800  # Log the statistics periodically (seconds).
+
+    class Stats:
+        def __init__(self):
+            self.calls = self.subprocesses = 0
+            self.samples = collections.deque(maxlen=Latency.SAMPLES)
+
+    __stats: dict[str, Stats] = {}
+    __last_report = time.perf_counter()
+    # The statistics of the function being called, the tasks and callbacks
+    # scheduled by the function inherit it, so the background subprocesses can be counted.
+    __current = contextvars.ContextVar("current_stats", default=None)
+
+    @staticmethod
+    def measure(func: Callable) -> Callable:
+        stats = Latency.__stats.setdefault(func.__qualname__, Latency.Stats())
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not Latency.ENABLED:
+                return func(*args, **kwargs)
+            token, start = Latency.__current.set(stats), time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                Latency.__current.reset(token)
+                stats.calls += 1
+                stats.samples.append(end - start)
+                if Trace.ENABLED:
+                    Trace.record(func.__qualname__, args, start, end - start)
+                if end - Latency.__last_report > Latency.REPORT_INTERVAL:
+                    Latency.report()
+
+        return wrapper
+
+    # Count the subprocess to the function being called.
+    @staticmethod
+    def count_subprocess():
+        if stats := Latency.__current.get():
+            stats.subprocesses += 1
+
+    @staticmethod
+    def stats() -> dict[str, dict]:
+        result = {}
+        for name, stats in Latency.__stats.items():
+            if samples := sorted(stats.samples):
+                result[name] = {
+                    "calls": stats.calls,
+                    "subprocesses": stats.subprocesses,
+                    "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+                    "p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 3),
+                }
+        return result
+
+    # Log the statistics, also called when Qtile shutdown.
+    @staticmethod
+    def report():
+        Latency.__last_report = time.perf_counter()
+        for name, stats in Latency.stats().items():
+            logger.warn(f"Latency of {name}: {stats}")
+
+    # Add the command to Qtile.
+    Qtile.cmd_handler_stats = lambda _: Latency.stats()
+
+
+# Run the external commands in Qtile event loop, avoid blocking the window management.
+class Command:
+    TIMEOUT = 5  # Kill the command after the timeout (seconds).
+    MAX_CONCURRENCY = 8
+    SLOW_COMMAND = 0.5  # Log the latency histogram when a command is slower than it.
+    # Upper bounds of the latency histogram buckets (milliseconds).
+    HISTOGRAM_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+    class Result(NamedTuple):
+        command: list[str]
+        returncode: int  # None if the command is killed by timeout.
+        stdout: str
+        stderr: str
+        duration: float  # Seconds.
+
+        @property
+        def ok(self) -> bool:
+            return self.returncode == 0
+
+    __semaphore: asyncio.Semaphore = None
+    __tasks: set[asyncio.Task] = set()
+    # Latency histograms keyed by the command name, each item counts a bucket.
+    __histograms: dict[str, list[int]] = {}
+
+    def __record_latency(result: Result):
+        name = os.path.basename(result.command[0])
+        histogram = Command.__histograms.setdefault(
+            name, [0] * len(Command.HISTOGRAM_BUCKETS)
+        )
+        latency = result.duration * 1000
+        histogram[
+            next(i for i, b in enumerate(Command.HISTOGRAM_BUCKETS) if latency <= b)
+        ] += 1
+        if result.duration > Command.SLOW_COMMAND:
+            logger.warn(
+                f"Slow command {result.command} took {latency:.0f}ms, "
+                f"latency histogram of {name}: {Command.format_histogram(name)}"
+            )
+
+    @staticmethod
+    def format_histogram(name: str) -> str:
+        return " ".join(
+            f"<={b}ms:{count}"
+            for b, count in zip(Command.HISTOGRAM_BUCKETS, Command.__histograms[name])
+            if count
+        )
+
+    # Log all the latency histograms, called when Qtile shutdown.
+    @staticmethod
+    def report():
+        for name in Command.__histograms:
+            logger.warn(
+                f"Latency histogram of {name}: {Command.format_histogram(name)}"
+            )
+
+    # Run the command without shell, the command string will be split like shell.
+    @staticmethod
+    async def run(command: str | list[str], timeout: float = TIMEOUT) -> Result:
+        command = shlex.split(command) if isinstance(command, str) else command
+        if not Command.__semaphore:
+            Command.__semaphore = asyncio.Semaphore(Command.MAX_CONCURRENCY)
+        Latency.count_subprocess()
+        async with Command.__semaphore:
+            start = time.monotonic()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except OSError as e:
+                return Command.Result(command, 127, "", str(e), 0)
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+                returncode = process.returncode
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.warn(f"Command {command} timeout after {timeout}s, killed.")
+                stdout, stderr, returncode = b"", b"", None
+        result = Command.Result(
+            command,
+            returncode,
+            stdout.decode().strip(),
+            stderr.decode().strip(),
+            time.monotonic() - start,
+        )
+        Command.__record_latency(result)
+        return result
+
+    # Start the long-running command (e.g. application) same as lazy.spawn(), return the pid.
+    # Qtile executes the command without shell and double-forks,
+    # so the process isn't the child of Qtile, and won't become zombie after Qtile restarted.
+    @staticmethod
+    def spawn(command: str | list[str]) -> int:
+        Latency.count_subprocess()
+        return libqtile.qtile.cmd_spawn(command)
+
+    # Run the coroutine in Qtile event loop, keep the task reference until it's done.
+    # The config is loaded before Qtile event loop starts, so delay the task to startup.
+    @staticmethod
+    def background(coroutine: Coroutine):
+        def run():
+            task = create_task(coroutine)
+            Command.__tasks.add(task)
+            task.add_done_callback(Command.__tasks.discard)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            hook.subscribe.startup(run)
+        else:
+            run()
+
+
+# Accumulate the deltas of repeated key events (e.g. holding the volume key),
+# then apply the sum by one operation.
+# The sum is applied after no more events arrive in the window,
+# and never later than the max delay after the first pending event.
+class DeltaAccumulator:
+    WINDOW = 0.08  # Seconds.
+    MAX_DELAY = 0.25  # Seconds.
+
+    def __init__(
+        self,
+        apply: Callable[[int], Coroutine],
+        window: float = WINDOW,
+        max_delay: float = MAX_DELAY,
+    ):
+        self.apply, self.window, self.max_delay = apply, window, max_delay
+        self.__delta, self.__deadline = 0, 0
+        self.__timer: asyncio.TimerHandle = None
+        self.__lock: asyncio.Lock = None
+
+    def add(self, delta: int):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.__timer:
+            self.__timer.cancel()
+        else:
+            self.__deadline = now + self.max_delay
+        self.__delta += delta
+        self.__timer = loop.call_at(
+            min(now + self.window, self.__deadline), self.__flush
+        )
+
+    def __flush(self):
+        delta, self.__delta, self.__timer = self.__delta, 0, None
+        if delta:  # Skip when the deltas cancel each other out.
+            Command.background(self.__apply(delta))
+
+    async def __apply(self, delta: int):
+        if not self.__lock:
+            self.__lock = asyncio.Lock()
+        async with self.__lock:  # Keep the order of the operations.
+            await self.apply(delta)
 
 
-# Get command ouput.
-def get_command_output(command: str) -> str:
-    return subprocess.check_output(
-        command,
-        shell=True,
-        text=True,
-    ).strip()  # Some reponse content contains '\n', clear special charactor.
+# Run the startup commands concurrently in background.
+class Startup:
+    # Futures of the normal commands, other components can wait the command finished.
+    __futures: dict[str, asyncio.Future] = {}
+
+    def __future(command: str) -> asyncio.Future:
+        if command not in Startup.__futures:
+            Startup.__futures[command] = asyncio.get_running_loop().create_future()
+        return Startup.__futures[command]
+
+    # Get the names of the processes owned by current user by one /proc scan,
+    # same as the process names matched by "pgrep -u $USER -x".
+    @staticmethod
+    def running_processes() -> set[str]:
+        names, uid = set(), os.getuid()
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                if os.stat(f"/proc/{pid}").st_uid == uid:
+                    with open(f"/proc/{pid}/comm") as f:
+                        names.add(f.read().strip())
+            except OSError:
+                pass  # The process has exited.
+        return names
+
+    async def __run_once(commands: list[str]) -> float:
+        start = time.monotonic()
+        running = Startup.running_processes()
+        for command in commands:
+            # The process name in /proc/<pid>/comm is truncated to 15 characters.
+            name = os.path.basename(shlex.split(command)[0])[:15]
+            if name not in running:
+                Command.spawn(command)
+        return time.monotonic() - start
+
+    async def __run_normal(command: str) -> float:
+        result = await Command.run(command)
+        Startup.__future(command).set_result(result)
+        if not result.ok:
+            logger.warn(f"Startup command [{command}] failed: {result.stderr}")
+        return result.duration
+
+    @staticmethod
+    async def run(once_commands: list[str], normal_commands: list[str]):
+        start = time.monotonic()
+        durations = await asyncio.gather(
+            Startup.__run_once(once_commands),
+            *[Startup.__run_normal(command) for command in normal_commands],
+        )
+        breakdown = ", ".join(
+            f"[{command}] {duration * 1000:.0f}ms"
+            for command, duration in zip(["once_cmds"] + normal_commands, durations)
+        )
+        logger.warn(
+            f"Startup commands finished in {(time.monotonic() - start) * 1000:.0f}ms: "
+            f"{breakdown}"
+        )
+
+    # Wait the startup command finished, return immediately if it isn't a startup command,
+    # or the startup commands had been run before the config reloaded.
+    @staticmethod
+    async def wait(command: str):
+        if Session.first_start and command in normal_cmds:
+            await Startup.__future(command)
+
+
+# Config reload shouldn't restart PulseAudio or reset the screen saver settings.
+if Session.first_start:
+    Command.background(Startup.run(once_cmds, normal_cmds))
+hook.subscribe.shutdown(Command.report)
+hook.subscribe.shutdown(Latency.report)
+Session.profile("commands")
 
 
 # Color settings.
@@ -118,56 +669,228 @@ class Application:
     LOCK_SCREEN = "dm-tool lock"
 
     # Find the next normal window (Skip the minimized window).
-    def next_normal_window(qtile: Qtile):
-        w = qtile.current_window  # Save current window.
-        if w:
-            # Skip minimized windows when switch windows.
-            while qtile.current_window.minimized:
-                qtile.current_group.cmd_next_window()
-                if qtile.current_window == w:
-                    # If current window is saved window,
-                    # means all window had been traversed (all windows are minimized),
-                    # break the loop to avoid the dead loop.
-                    break
+    # Walk the group focus order (same as cmd_next_window()) without changing focus,
+    # then focus the found window only once, avoid the focus events of minimized windows.
+    # By default only switch window when the current window is minimized,
+    # set the "skip_current" to always switch to the next normal window.
+    def next_normal_window(
+        qtile: Qtile, prev: bool = False, skip_current: bool = False
+    ):
+        group, w = qtile.current_group, qtile.current_window
+        if not w or not (skip_current or w.minimized):
+            return
+        tiled, floating = group.layout, group.floating_layout
+
+        def step(c: Window) -> Window:
+            if prev:
+                if c.floating:
+                    return (
+                        floating.focus_previous(c)
+                        or tiled.focus_last()
+                        or floating.focus_last(group=group)
+                    )
+                return (
+                    tiled.focus_previous(c)
+                    or floating.focus_last(group=group)
+                    or tiled.focus_last()
+                )
+            if c.floating:
+                return (
+                    floating.focus_next(c)
+                    or tiled.focus_first()
+                    or floating.focus_first(group=group)
+                )
+            return (
+                tiled.focus_next(c)
+                or floating.focus_first(group=group)
+                or tiled.focus_first()
+            )
+
+        candidate, visited = step(w), {w}
+        while candidate and candidate.minimized and candidate not in visited:
+            visited.add(candidate)
+            candidate = step(candidate)
+        # If all windows had been traversed (all windows are minimized), keep the focus.
+        if candidate and not candidate.minimized and candidate != w:
+            # Should use Group API to change the window focus,
+            # change focus with Window API won't change window border color.
+            group.focus(candidate, True)
 
     # Bind the method to Qtile class
     Qtile.next_normal_window = next_normal_window
 
     class Terminal:
         MATCH_RULE = Match(wm_class="kitty")
-        GROUP_NAME, COMMAND = "", "env GLFW_IM_MODULE=ibus kitty"
+        GROUP_NAME, COMMAND = "", ["kitty"]
+        ENV = {"GLFW_IM_MODULE": "ibus"}  # Passed to the terminal by the env command.
+        # Keep a hidden terminal in the terminal group,
+        # so "mod+Return" shows an existing terminal instead of waiting for the cold start.
+        KEEP_WARM = False
+
+        __warm_pid: int = None  # The warm terminal process which hasn't been mapped.
 
         # Add method to Window class.
         Window.is_terminal = lambda c: c and c.match(Application.Terminal.MATCH_RULE)
 
         @staticmethod
-        def generate_command(
-            run_background: bool = False, run_other_command: str = None
-        ) -> str:
-            backgroud = "&" if run_background else ""
-            other_command = f"--hold {run_other_command}" if run_other_command else ""
-            return f"{Application.Terminal.COMMAND} {backgroud} {other_command}"
+        def command(run_other_command: str = None) -> list[str]:
+            other_command = (
+                ["--hold", *shlex.split(run_other_command)] if run_other_command else []
+            )
+            return [*Application.Terminal.COMMAND, *other_command]
+
+        # The command line for the Qtile API which only accepts string (e.g. DropDown),
+        # Qtile splits the string and executes it without shell.
+        @staticmethod
+        def command_line(run_other_command: str = None) -> str:
+            env = [f"{k}={v}" for k, v in Application.Terminal.ENV.items()]
+            return shlex.join(
+                ["env", *env, *Application.Terminal.command(run_other_command)]
+            )
+
+        # Return the pid, the env command executes the terminal in the same process.
+        @staticmethod
+        def launch(run_other_command: str = None) -> int:
+            return Command.spawn(Application.Terminal.command_line(run_other_command))
+
+        # Start the warm terminal if it's enabled and not starting.
+        @staticmethod
+        def warm_up():
+            if Application.Terminal.KEEP_WARM and not Application.Terminal.__warm_pid:
+                Application.Terminal.__warm_pid = Application.Terminal.launch()
+
+        # Move the warm terminal to the terminal group when it's mapped.
+        @staticmethod
+        def hide_warm(w: Window):
+            if Application.Terminal.__warm_pid and (
+                w.get_pid() == Application.Terminal.__warm_pid
+            ):
+                Application.Terminal.__warm_pid = None
+                w.togroup(Application.Terminal.GROUP_NAME)
+
+
+# Prepare the warm terminal after Qtile started.
+if Session.first_start:
+    hook.subscribe.startup(Application.Terminal.warm_up)
 
 
 # Sound control settings.
 class VolumeControl:
-    # ALSA commands.
-    GET_VOLUME = "amixer get -M Master | grep -Po '\d+(?=%)'"
-    CHECK_MUTE = "amixer get -M Master | grep -Po '\[(o|n|f)+\]'"
-    MUTE_STATUS = "[off]"
-    MUTE_TOGGLE = "amixer set Master toggle"
+    # ALSA commands, every command prints the mixer state after it executed.
+    GET_STATE = ["amixer", "get", "-M", "Master"]
+    SET_VOLUME = ["amixer", "set", "-M", "Master"]
+    MUTE_TOGGLE = ["amixer", "set", "-M", "Master", "toggle"]
+    # Match the first channel line, e.g. "Mono: Playback 26214 [40%] [on]".
+    # The switch is optional, e.g. "Mono: Playback 30 [50%] [-10dB]" has no mute switch.
+    STATE_PATTERN = re.compile(r"\[(\d+)%\](?:.*?\[(on|off)\])?")
+    # Long-lived mixer event source, each output line means the mixer state may be changed.
+    # Any command with the same behavior can be used, e.g. ["alsactl", "monitor"].
+    EVENT_SOURCE = ["amixer", "events"]
+    EVENT_DELAY = 0.05  # Merge a burst of mixer events into one state refresh.
+    RESTART_DELAY = 5  # Wait before restart the event source when it exited.
+
+    class State(NamedTuple):
+        volume: int
+        mute: bool
+
+    # Cached mixer state, updated by mixer events and volume key bindings.
+    __state: State = None
+    __listeners: list[Callable[[str], None]] = []
+    __watcher: asyncio.Task = None
+    __refresh_pending = False
+    # Merge the volume changes from key repeat.
+    __volume_changes = DeltaAccumulator(
+        lambda volume: VolumeControl.__change_volume(volume)
+    )
+
+    # Parse the mixer state from the output of amixer get/set command,
+    # the control without mute switch is always unmuted.
+    @staticmethod
+    def parse_state(output: str) -> State:
+        if not (match := VolumeControl.STATE_PATTERN.search(output)):
+            return None
+        volume, status = match.groups()
+        return VolumeControl.State(int(volume), status == "off")
+
+    # Run the amixer command and parse the mixer state from its output.
+    @staticmethod
+    async def read_state(command: list[str] = GET_STATE) -> State:
+        result = await Command.run(command)
+        if not result.ok:
+            logger.warn(f"Read mixer state failed: {result.stderr}")
+            return None
+        if not (state := VolumeControl.parse_state(result.stdout)):
+            logger.warn(f"Parse mixer state failed: {result.stdout}")
+        return state
+
+    # Save the new mixer state, notify the listeners only when the state changed.
+    def __update_state(state: State):
+        if not state or state == VolumeControl.__state:
+            return
+        VolumeControl.__state = state
+        if VolumeControl.__listeners:
+            text = VolumeControl.get_volume_text()
+            for listener in VolumeControl.__listeners:
+                listener(text)
 
-    def __get_volume() -> int:
-        return int(get_command_output(VolumeControl.GET_VOLUME))
+    async def __refresh(delay: float = 0):
+        VolumeControl.__refresh_pending = True
+        await asyncio.sleep(delay)
+        VolumeControl.__refresh_pending = False
+        VolumeControl.__update_state(await VolumeControl.read_state())
+
+    async def __watch_events():
+        await Startup.wait(start_pulseaudio)
+        await VolumeControl.__refresh()  # Read the initial mixer state.
+        while True:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *VolumeControl.EVENT_SOURCE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+            except OSError as e:
+                logger.warn(f"Can't start mixer event source: {e}")
+                return
+            try:
+                async for _ in process.stdout:
+                    if not VolumeControl.__refresh_pending:
+                        Command.background(
+                            VolumeControl.__refresh(VolumeControl.EVENT_DELAY)
+                        )
+            finally:
+                if process.returncode is None:
+                    process.kill()
+            logger.warn("Mixer event source exited, restart it later ...")
+            await asyncio.sleep(VolumeControl.RESTART_DELAY)
+            await VolumeControl.__refresh()  # Events may be lost during the restart.
+
+    # Register a callback which receives the new volume text when the mixer state changed.
+    @staticmethod
+    def subscribe(listener: Callable[[str], None]):
+        if listener not in VolumeControl.__listeners:
+            VolumeControl.__listeners.append(listener)
+
+    @staticmethod
+    def unsubscribe(listener: Callable[[str], None]):
+        VolumeControl.__listeners.remove(listener)
+        if not VolumeControl.__listeners and VolumeControl.__watcher:
+            # No one cares the mixer state, stop the event source.
+            VolumeControl.__watcher.cancel()
+            VolumeControl.__watcher = None
 
-    def __is_mute() -> bool:
-        status = get_command_output(VolumeControl.CHECK_MUTE)
-        return status == VolumeControl.MUTE_STATUS
+    # Start the mixer event source, must be called in Qtile event loop.
+    @staticmethod
+    def watch():
+        if not VolumeControl.__watcher:
+            VolumeControl.__watcher = create_task(VolumeControl.__watch_events())
 
     @staticmethod
+    @Latency.measure
     def get_volume_text() -> str:
-        percent = VolumeControl.__get_volume()
-        not_mute = not VolumeControl.__is_mute()
+        if not VolumeControl.__state:
+            return "🔈 ..."  # The mixer state haven't been read.
+        percent, not_mute = VolumeControl.__state.volume, not VolumeControl.__state.mute
         status = "ON" if not_mute else "OFF"
         volume_emoji = (
             "🔊"
@@ -182,9 +905,16 @@ class VolumeControl:
 
     @staticmethod
     @lazy.function
+    @Latency.measure
     def change_mute(_):
-        state = "🔊 ON" if VolumeControl.__is_mute() else "🔇 OFF"
-        os.system(VolumeControl.MUTE_TOGGLE)
+        Command.background(VolumeControl.__change_mute())
+
+    async def __change_mute():
+        new_state = await VolumeControl.read_state(VolumeControl.MUTE_TOGGLE)
+        if not new_state:
+            return
+        VolumeControl.__update_state(new_state)
+        state = "🔇 OFF" if new_state.mute else "🔊 ON"
         send_notification(
             "🔈 Volume State Changed",
             f"Sound state has been changed ...\nCurrent sound state is [{state}]!",
@@ -193,41 +923,129 @@ class VolumeControl:
 
     @staticmethod
     @lazy.function
+    @Latency.measure
     def change_volume(_, volume: int):
+        VolumeControl.__volume_changes.add(volume)
+
+    async def __change_volume(volume: int):
         op, volume_change = ("+", "rise up ⬆️") if volume > 0 else ("-", "lower ⬇️")
-        os.system(f"amixer set -M Master {abs(volume)}%{op}")
-        new_volume = VolumeControl.__get_volume()
+        new_state = await VolumeControl.read_state(
+            [*VolumeControl.SET_VOLUME, f"{abs(volume)}%{op}"]
+        )
+        if not new_state:
+            return
+        VolumeControl.__update_state(new_state)
         send_notification(
             "🔈 Volume Changed",
-            f"Volume {volume_change} ({new_volume}%)",
+            f"Volume {volume_change} ({new_state.volume}%)",
             NotificationType.CHANGE_VOLUME,
-            new_volume,
+            new_state.volume,
         )
 
+    # Volume widget, redraw only when the cached mixer state changed.
+    class Widget(widget.TextBox):
+        def _configure(self, qtile, bar):
+            self.text = VolumeControl.get_volume_text()  # Show the cached state first.
+            widget.TextBox._configure(self, qtile, bar)
+            VolumeControl.subscribe(self.update)
 
-@lazy.function
-def change_brightness(_, value: int):
-    # Check if 'brightnessctl' tool exist.
-    if os.system("brightnessctl") > 0:
+        def timer_setup(self):
+            VolumeControl.watch()  # The timer_setup() is called in Qtile event loop.
+
+        def finalize(self):
+            VolumeControl.unsubscribe(self.update)
+            widget.TextBox.finalize(self)
+
+
+# Backlight control settings.
+class BrightnessControl:
+    SYSFS_PATH = "/sys/class/backlight"
+    # Fallback tool when the sysfs isn't writable, "-m" outputs machine readable text,
+    # e.g. "intel_backlight,backlight,1234,26%,4794".
+    TOOL = "brightnessctl"
+    TOOL_SET = [TOOL, "-m", "set"]
+
+    # Detected backlight backend, the sysfs device path or the fallback tool.
+    device: str = None
+    max_brightness: int = None
+    tool: str = None
+
+    # Find the usable backlight backend, called once on the first brightness change,
+    # the config loading doesn't wait the sysfs scan and the tool lookup in PATH.
+    @staticmethod
+    @functools.cache
+    def detect():
+        BrightnessControl.device = BrightnessControl.tool = None
+        if os.path.isdir(BrightnessControl.SYSFS_PATH):
+            for name in sorted(os.listdir(BrightnessControl.SYSFS_PATH)):
+                device = os.path.join(BrightnessControl.SYSFS_PATH, name)
+                if os.access(os.path.join(device, "brightness"), os.W_OK):
+                    BrightnessControl.device = device
+                    with open(os.path.join(device, "max_brightness")) as f:
+                        BrightnessControl.max_brightness = int(f.read())
+                    return
+        BrightnessControl.tool = shutil.which(BrightnessControl.TOOL)
+
+    # Change the brightness by the sysfs, return the new brightness percent.
+    def __change_by_sysfs(value: int) -> int:
+        path = os.path.join(BrightnessControl.device, "brightness")
+        with open(path) as f:
+            current = int(f.read())
+        maximum = BrightnessControl.max_brightness
+        # Round the step and change at least 1 level, the devices may have few levels (e.g. 15).
+        step = max(1, round(abs(value) * maximum / 100))
+        brightness = min(max(current + (step if value > 0 else -step), 0), maximum)
+        with open(path, "w") as f:
+            f.write(str(brightness))
+        return round(brightness * 100 / maximum)
+
+    # Change the brightness by the fallback tool, return the new brightness percent.
+    async def __change_by_tool(value: int) -> int:
+        if value > 0:
+            prefix, suffix = "+", ""
+        else:
+            prefix, suffix = "", "-"
+        result = await Command.run(
+            [*BrightnessControl.TOOL_SET, f"{prefix}{abs(value)}%{suffix}"]
+        )
+        return int(result.stdout.split(",")[3].rstrip("%")) if result.ok else None
+
+    async def __change_brightness(value: int):
+        BrightnessControl.detect()
+        if BrightnessControl.device:
+            brightness = BrightnessControl.__change_by_sysfs(value)
+        elif BrightnessControl.tool:
+            brightness = await BrightnessControl.__change_by_tool(value)
+        else:
+            send_notification(
+                "Tool not found!",
+                'Change brightness need tool "brightnessctl".\nPlease install this tool.',
+            )
+            return
+        if brightness is None:
+            return
+        content = "up ⬆️" if value > 0 else "down ⬇️"
         send_notification(
-            "Tool not found!",
-            'Change brightness need tool "brightnessctl".\nPlease install this tool.',
+            "💡 Brightness Changed",
+            f"Background brightness {content} ({brightness}%)",
+            NotificationType.CHANGE_BRIGHTNESS,
+            brightness,
         )
-    if value > 0:
-        prefix, suffix, content = "+", "", "up ⬆️"
-    else:
-        prefix, suffix, content = "", "-", "down ⬇️"
-    os.system(f"brightnessctl set {prefix}{abs(value)}%{suffix}")
-    brightness = int(get_command_output("brightnessctl | grep -Po '\\d+(?=\\%\\))'"))
-    send_notification(
-        "💡 Brightness Changed",
-        f"Background brightness {content} ({brightness}%)",
-        NotificationType.CHANGE_BRIGHTNESS,
-        brightness,
+
+    # Merge the brightness changes from key repeat.
+    __brightness_changes = DeltaAccumulator(
+        lambda value: BrightnessControl.__change_brightness(value)
     )
 
+    @staticmethod
+    @lazy.function
+    @Latency.measure
+    def change_brightness(_, value: int):
+        BrightnessControl.__brightness_changes.add(value)
+
 
 @lazy.function
+@Latency.measure
 def change_layout(qtile: Qtile, prev: bool = False):
     if prev:
         state = "prev"
@@ -242,42 +1060,183 @@ def change_layout(qtile: Qtile, prev: bool = False):
     )
 
 
+# Index the terminal windows of each group (in the group window order),
+# avoid matching all windows on every key press and focus change.
+# The index is updated by the window hooks.
+class TerminalIndex:
+    __groups: dict[str, dict[Window, None]] = {}  # Use dict as the ordered set.
+    __window_groups: dict[Window, str] = {}
+    __built = False
+
+    @staticmethod
+    def add(group_name: str, w: Window):
+        TerminalIndex.remove(w)  # The window may be moved from other group.
+        if w.is_terminal():
+            TerminalIndex.__groups.setdefault(group_name, {})[w] = None
+            TerminalIndex.__window_groups[w] = group_name
+
+    @staticmethod
+    def remove(w: Window):
+        group_name = TerminalIndex.__window_groups.pop(w, None)
+        if group_name is not None:
+            del TerminalIndex.__groups[group_name][w]
+
+    def __build(qtile: Qtile):
+        if not TerminalIndex.__built:
+            # The windows existed before config (re)loaded haven't been indexed by hooks.
+            TerminalIndex.__built = True
+            for group in qtile.groups:
+                for w in group.windows:
+                    TerminalIndex.add(group.name, w)
+
+    @staticmethod
+    def terminals(qtile: Qtile, group_name: str) -> list[Window]:
+        TerminalIndex.__build(qtile)
+        return list(TerminalIndex.__groups.get(group_name, ()))
+
+    # Get the floating terminals of group in the group window order.
+    # Check the floating state when queried, Qtile fires "group_window_add" before
+    # the new window floated by the float rules, and no "float_change" for that.
+    @staticmethod
+    def floating_terminals(qtile: Qtile, group_name: str) -> list[Window]:
+        TerminalIndex.__build(qtile)
+        return [w for w in TerminalIndex.__groups.get(group_name, ()) if w.floating]
+
+
+# Record the minimized windows of each group in the minimize order,
+# so the most recently minimized window can be restored first.
+class MinimizedStack:
+    __groups: dict[str, dict[Window, None]] = {}  # Use dict as the ordered set.
+    __window_groups: dict[Window, str] = {}
+
+    @staticmethod
+    def push(group_name: str, w: Window):
+        MinimizedStack.remove(w)
+        MinimizedStack.__groups.setdefault(group_name, {})[w] = None
+        MinimizedStack.__window_groups[w] = group_name
+
+    @staticmethod
+    def remove(w: Window):
+        group_name = MinimizedStack.__window_groups.pop(w, None)
+        if group_name is not None:
+            del MinimizedStack.__groups[group_name][w]
+
+    # Keep the minimized window in stack when it's moved to other group.
+    @staticmethod
+    def move(group_name: str, w: Window):
+        if w in MinimizedStack.__window_groups:
+            if w.minimized:
+                MinimizedStack.push(group_name, w)
+            else:
+                MinimizedStack.remove(w)
+
+    # Pop the most recently minimized window of the group.
+    @staticmethod
+    def pop(group) -> Window:
+        stack = MinimizedStack.__groups.get(group.name)
+        while stack:
+            w = next(reversed(stack))
+            MinimizedStack.remove(w)
+            if w.minimized:  # Skip the window restored by other ways.
+                return w
+        # The windows minimized by other ways (or before config reloaded) aren't in stack.
+        return next((w for w in group.windows if w.minimized), None)
+
+    # Pop all minimized windows of the group, the most recently minimized window is the last.
+    @staticmethod
+    def pop_all(group) -> list[Window]:
+        stack = MinimizedStack.__groups.get(group.name, {})
+        windows = [w for w in group.windows if w.minimized and w not in stack]
+        windows += [w for w in stack if w.minimized]
+        for w in list(stack):
+            MinimizedStack.remove(w)
+        return windows
+
+
+# Defer the layout and focus of the groups until all window operations finished,
+# then focus the last requested window (Group.focus() also layouts) or layout each group only once.
+@contextlib.contextmanager
+def deferred_layout(groups: set):
+    focus_requests = {}
+
+    def defer_focus(group):
+        def focus(w: Window, *_, **__):
+            focus_requests[group] = w  # Only the last requested window will be focused.
+
+        return focus
+
+    for group in groups:
+        group.layout_all = lambda *_, **__: None  # Defer the layout.
+        group.focus = defer_focus(group)
+    try:
+        yield
+    finally:
+        for group in groups:
+            # Restore the methods of Group class.
+            del group.layout_all
+            del group.focus
+            if group not in focus_requests:
+                group.layout_all()
+                continue
+            w = focus_requests[group]
+            if w and w.group is not group:  # The window has been moved out later.
+                w = group.layout.focus_first() or group.floating_layout.focus_first(
+                    group=group
+                )
+            group.focus(w, True)
+
+
+# Move the windows to the group one by one,
+# but only layout and fix the focus of the source and destination groups once after all windows moved.
+# Move in reverse order to keep the windows order of the "reverse" operations,
+# e.g. hide the terminals then show them one by one from the last.
+def move_windows(
+    qtile: Qtile, windows: list[Window], group_name: str, reverse: bool = False
+):
+    groups = {w.group for w in windows if w.group}
+    groups.add(qtile.groups_map[group_name])
+    with deferred_layout(groups):
+        for w in reversed(windows) if reverse else windows:
+            w.togroup(group_name)
+
+
 # Custom functions for key bindings.
 # Don't use lazy api in lazy function.
 @lazy.function
+@Latency.measure
 def open_terminal_by_need(qtile: Qtile):
-    next_terminal = None
     # First try to get terminal window from terminal group.
-    for w in qtile.groups_map.get(Application.Terminal.GROUP_NAME).windows:
-        if w.is_terminal():
-            next_terminal = w
+    terminals = TerminalIndex.terminals(qtile, Application.Terminal.GROUP_NAME)
+    next_terminal = terminals[-1] if terminals else None
     if next_terminal:
         # Move terminal window from terminal group to current group.
         next_terminal.togroup(qtile.current_group.name, switch_group=True)
+        if len(terminals) == 1:  # The terminal group is empty, prepare the next one.
+            Application.Terminal.warm_up()
     else:
         first_other_terminal, after_current = None, False
         # If no terminal window in terminal group, then try to find window in current group.
-        for w in qtile.current_group.windows:
-            if w.is_terminal():
-                if after_current:
-                    next_terminal = w
-                    break
-                if w != qtile.current_window:
-                    if not first_other_terminal:
-                        # Backup the first other terminal window.
-                        first_other_terminal = w
-                else:
-                    # Mark if the index is after current terminal window.
-                    after_current = True
+        for w in TerminalIndex.terminals(qtile, qtile.current_group.name):
+            if after_current:
+                next_terminal = w
+                break
+            if w != qtile.current_window:
+                if not first_other_terminal:
+                    # Backup the first other terminal window.
+                    first_other_terminal = w
+            else:
+                # Mark if the index is after current terminal window.
+                after_current = True
         if next_terminal or first_other_terminal:
             # Should use Group API to change the window focus,
             # change focus with Window API won't change window border color.
             qtile.current_group.focus(next_terminal or first_other_terminal, True)
         elif not qtile.current_window or not qtile.current_window.is_terminal():
-            os.system(Application.Terminal.generate_command(run_background=True))
+            Application.Terminal.launch()
 
 
 @lazy.function
+@Latency.measure
 def toggle_window(
     qtile: Qtile,
     operate: Callable[[Window], None],
@@ -287,6 +1246,10 @@ def toggle_window(
     if w:
         # The default toggle operation (like fullscreen/minimize) will make floating mark useless.
         operate(w)
+        if w.minimized:
+            MinimizedStack.push(w.group.name, w)
+        else:
+            MinimizedStack.remove(w)
         # Skip minimized windows when switch windows.
         qtile.next_normal_window()  # Custom method.
         # Check if the current window is terminal, terminal window need to restore floating state.
@@ -298,40 +1261,58 @@ def toggle_window(
 
 
 @lazy.function
+@Latency.measure
 def hide_floating_terminals(qtile: Qtile):
-    terminals = [
-        w for w in qtile.current_group.windows if w.floating and w.is_terminal()
-    ]
-    terminals.reverse()  # Reverse terminal windows' order, then move to terminal group.
-    [w.togroup(Application.Terminal.GROUP_NAME) for w in terminals]
+    terminals = TerminalIndex.floating_terminals(qtile, qtile.current_group.name)
+    # Reverse terminal windows' order, then move to terminal group.
+    move_windows(qtile, terminals, Application.Terminal.GROUP_NAME, reverse=True)
 
 
 @lazy.function
+@Latency.measure
 def next_window(qtile: Qtile):
     w = qtile.current_window
     if w and not w.fullscreen:
         # Only switch window when the current window isn't fullscreen.
-        qtile.current_group.cmd_next_window()
         # Skip minimized windows when switch windows.
-        qtile.next_normal_window()  # Custom method.
+        qtile.next_normal_window(skip_current=True)  # Custom method.
 
 
 @lazy.function
+@Latency.measure
 def prev_window(qtile: Qtile):
     w = qtile.current_window
     if w and not w.fullscreen:
-        qtile.current_group.cmd_prev_window()
         # Skip minimized windows when switch windows.
-        qtile.next_normal_window()  # Custom method.
+        qtile.next_normal_window(prev=True, skip_current=True)  # Custom method.
 
 
 @lazy.function
+@Latency.measure
 def restore_minimized_window(qtile: Qtile):
-    for w in qtile.current_group.windows:
-        if w.minimized:
-            w.toggle_minimize()
-            qtile.current_group.focus(w)
-            break  # Only restore one window each time.
+    # Only restore the most recently minimized window each time.
+    w = MinimizedStack.pop(qtile.current_group)
+    if w:
+        w.toggle_minimize()
+        qtile.current_group.focus(w)
+
+
+@lazy.function
+@Latency.measure
+def restore_all_minimized_windows(qtile: Qtile):
+    group = qtile.current_group
+    windows = MinimizedStack.pop_all(group)
+    if windows:
+        with deferred_layout({group}):
+            [w.toggle_minimize() for w in windows]
+            group.focus(windows[-1])  # Focus the most recently minimized window.
+
+
+@lazy.function
+@Latency.measure
+def lock_screen(_):
+    Command.spawn(Application.LOCK_SCREEN)
+    Activity.lock()  # Slow down the polling widgets until unlocked.
 
 
 keys = [
@@ -371,6 +1352,12 @@ keys = [
     Key(
         [mod, "control"], "b", restore_minimized_window, desc="Restore minimized window"
     ),
+    Key(
+        [mod, "shift"],
+        "b",
+        restore_all_minimized_windows,
+        desc="Restore all minimized windows",
+    ),
     Key(
         [mod, "control"],
         "m",
@@ -405,21 +1392,17 @@ keys = [
     Key([mod], "m", lazy.spawn(Application.MAIL), desc="Mail"),
     Key([mod], "b", lazy.spawn(Application.BROWSER), desc="Google Chrome Browser"),
     Key([mod], "d", lazy.spawn(Application.DICTIONARY), desc="Golden Dict"),
-    Key([mod], "l", lazy.spawn(Application.LOCK_SCREEN), desc="Lock Screen"),
+    Key([mod], "l", lock_screen, desc="Lock Screen"),
     Key(
         [mod],
         "t",
-        lazy.spawn(Application.Terminal.generate_command(run_other_command="btop")),
+        lazy.spawn(Application.Terminal.command_line("btop")),
         desc="Top",
     ),
     Key(
         [mod],
         "f",
-        lazy.spawn(
-            Application.Terminal.generate_command(
-                run_other_command=Application.FILE_MANAGER
-            )
-        ),
+        lazy.spawn(Application.Terminal.command_line(Application.FILE_MANAGER)),
         desc="Ranger file manager",
     ),
     Key(
@@ -431,7 +1414,7 @@ keys = [
     Key(
         [mod, "control"],  # Launch a new terminal.
         "Return",
-        lazy.spawn(Application.Terminal.generate_command()),
+        lazy.spawn(Application.Terminal.command_line()),
         desc="Launch terminal",
     ),
     Key(
@@ -479,7 +1462,7 @@ keys = [
         Key(
             m,
             f"XF86MonBrightness{d}",
-            change_brightness(v),
+            BrightnessControl.change_brightness(v),
             desc="Change the brightness",
         )
         for (m, d, v) in [
@@ -491,6 +1474,8 @@ keys = [
     ],
 ]
 
+Session.profile("keys")
+
 # Add groups.
 groups = [Group(i) for i in f"➊➋➌➍"]
 # Set up group keys.
@@ -521,23 +1506,107 @@ groups.extend(
             "Scratchpad",
             # Define a drop down terminal.
             # It placed in the upper third of screen by default.
-            [DropDown("DropDown", Application.Terminal.generate_command(), height=0.5)],
+            [DropDown("DropDown", Application.Terminal.command_line(), height=0.5)],
         ),
     ]
 )
 keys.extend([Key([mod], "s", lazy.group["Scratchpad"].dropdown_toggle("DropDown"))])
+Session.profile("groups")
 
 
-# Get system current DPI, than caculate the scaling factor.
-current_dpi = int(
-    get_command_output("grep -Po '(?<=DPI set to \\()\\d+' /var/log/X*.0.log")
-)
-logger.warn(f"Current DPI is {current_dpi}")
+# Detect the DPI of each screen, than caculate the scaling factor.
+# Query the X server directly, the user defined "Xft.dpi" in Xresources is preferred,
+# otherwise use the DPI of the X screen (same as the "DPI set to" in Xorg log),
+# only with several monitors, use the physical DPI of each RandR output.
+# Fallback to scan the Xorg log, then the standard DPI only when X server can't be queried.
+class Dpi:
+    STANDARD = 96
+    XFT_PATTERN = re.compile(r"^Xft\.dpi:\s*(\d+)", re.MULTILINE)
+    LOG_PATTERN = re.compile(r"DPI set to \((\d+)")
+    LOG_PATHS = ["/var/log/X*.0.log", "~/.local/share/xorg/Xorg.0.log"]
+
+    # Get the DPI from the Xresources, X screen or RandR outputs (ordered by the position).
+    def __query_x(conn: "xcffib.Connection", root: "xcffib.xproto.Screen") -> list[int]:
+        resources = (
+            conn.core.GetProperty(
+                False,
+                root.root,
+                xcffib.xproto.Atom.RESOURCE_MANAGER,
+                xcffib.xproto.Atom.STRING,
+                0,
+                1 << 16,
+            )
+            .reply()
+            .value.to_string()
+        )
+        randr = conn(xcffib.randr.key)
+        resources_reply = randr.GetScreenResourcesCurrent(root.root).reply()
+        outputs = []
+        for crtc in resources_reply.crtcs:
+            info = randr.GetCrtcInfo(crtc, resources_reply.config_timestamp).reply()
+            if not info.num_outputs or not info.width:
+                continue  # The CRTC is disabled.
+            output = randr.GetOutputInfo(
+                info.outputs[0], resources_reply.config_timestamp
+            ).reply()
+            dpi = round(info.width * 25.4 / output.mm_width) if output.mm_width else 0
+            outputs.append((info.x, info.y, dpi))
+        if root.width_in_millimeters:
+            screen_dpi = round(root.width_in_pixels * 25.4 / root.width_in_millimeters)
+        else:
+            screen_dpi = Dpi.STANDARD
+        if xft := Dpi.XFT_PATTERN.search(resources):
+            return [int(xft.group(1))] * max(len(outputs), 1)
+        # Single monitor or RandR isn't available, keep the X server DPI.
+        if len(outputs) <= 1:
+            return [screen_dpi]
+        return [dpi or screen_dpi for _, _, dpi in sorted(outputs)]
+
+    # Scan the Xorg logs, use the last DPI set by X server.
+    def __scan_log() -> int:
+        for pattern in Dpi.LOG_PATHS:
+            for path in glob.glob(os.path.expanduser(pattern)):
+                with open(path, errors="ignore") as f:
+                    if matches := Dpi.LOG_PATTERN.findall(f.read()):
+                        return int(matches[-1])
+        return None
+
+    # Get the DPI of each screen.
+    @staticmethod
+    def detect() -> list[int]:
+        conn = None
+        if xcffib:
+            try:
+                conn = xcffib.connect()
+            except xcffib.ConnectionException:
+                pass  # Not in X session.
+        if not conn:
+            return [Dpi.__scan_log() or Dpi.STANDARD]
+        try:
+            # The connection setup is received during connect, reading it costs no request.
+            root = conn.get_setup().roots[conn.pref_screen]
+            return Dpi.__query_x(conn, root)
+        except Exception as e:
+            logger.warn(f"Query DPI from X server failed: {e}")
+            return [Dpi.__scan_log() or Dpi.STANDARD]
+        finally:
+            conn.disconnect()
 
-# Caculate the border and font size with scaling factor.
-def scaling_size(origin_size: int) -> int:
-    standard_dpi = 96
-    scaling_factor = current_dpi / standard_dpi
+
+# Detect the DPI once in a session, the config reload reuses it.
+# Forget it when the screens changed, so the next reload detects again.
+screen_dpis = Session.cached("screen_dpis", Dpi.detect)
+current_dpi = screen_dpis[0]  # The DPI of the primary screen.
+logger.warn(f"Current DPI is {current_dpi}, DPI of each screen: {screen_dpis}")
+hook.subscribe.screen_change(lambda *_: Session.forget("screen_dpis"))
+Session.profile("dpi")
+
+
+# Caculate the border and font size with scaling factor of the screen.
+@functools.cache
+def scaling_size(origin_size: int, screen: int = 0) -> int:
+    dpi = screen_dpis[screen] if screen < len(screen_dpis) else current_dpi
+    scaling_factor = dpi / Dpi.STANDARD
     return int(origin_size * scaling_factor)
 
 
@@ -549,31 +1618,534 @@ bar_height, margin, border_width = scaling_size(25), scaling_size(5), scaling_si
 widget_defaults = dict(
     font="Cascadia Code PL", fontsize=font_size, padding=font_padding
 )
-screens = [
+
+
+# Detect the user activity for the polling widgets,
+# the idle time and the screen power state are queried by the X ScreenSaver and DPMS extensions.
+class Activity:
+    ACTIVE, IDLE, LOCKED, OFF = "active", "idle", "locked", "off"
+    IDLE_AFTER = 120  # Seconds without user input.
+    LOCK_GRACE = 2  # Seconds, ignore the input of the lock key binding itself.
+    POWER_SUPPLY_PATH = "/sys/class/power_supply"
+    POWER_CHECK_INTERVAL = 60  # Seconds, the power supply changes rarely.
+
+    __conn: "xcffib.Connection" = None
+    __available = bool(xcffib)  # Disabled when the X server can't be queried.
+    __locked_at: float = None
+    __on_battery, __power_checked_at = False, None
+
+    # Mark the screen locked until the next user input, called by the lock key binding.
+    @staticmethod
+    def lock():
+        Activity.__locked_at = time.monotonic()
+
+    # Get the idle seconds and whether the screen is on, by one round trip.
+    def __query_x() -> tuple[float, bool]:
+        if not Activity.__conn:
+            Activity.__conn = xcffib.connect()
+        conn = Activity.__conn
+        root = conn.get_setup().roots[conn.pref_screen].root
+        idle_cookie = conn(xcffib.screensaver.key).QueryInfo(root)
+        dpms_cookie = conn(xcffib.dpms.key).Info()
+        idle = idle_cookie.reply().ms_since_user_input / 1000
+        dpms = dpms_cookie.reply()
+        return idle, not dpms.state or dpms.power_level == xcffib.dpms.DPMSMode.On
+
+    # Close the X connection when no one polls, the next query reconnects.
+    @staticmethod
+    def disconnect():
+        if Activity.__conn:
+            Activity.__conn.disconnect()
+            Activity.__conn = None
+
+    @staticmethod
+    def state() -> str:
+        if not Activity.__available:
+            return Activity.ACTIVE
+        try:
+            idle, screen_on = Activity.__query_x()
+        except Exception as e:
+            logger.warn(f"Query user activity failed, stop adapting the polling: {e}")
+            Activity.__available = False
+            Activity.disconnect()
+            return Activity.ACTIVE
+        if not screen_on:
+            return Activity.OFF
+        if Activity.__locked_at is not None:
+            locked_time = time.monotonic() - Activity.__locked_at
+            if idle > locked_time - Activity.LOCK_GRACE:
+                return Activity.LOCKED
+            Activity.__locked_at = None  # The user input after locking, unlocked.
+        return Activity.IDLE if idle >= Activity.IDLE_AFTER else Activity.ACTIVE
+
+    # Check whether all mains power supplies are offline.
+    @staticmethod
+    def on_battery() -> bool:
+        now = time.monotonic()
+        checked_at = Activity.__power_checked_at
+        if checked_at is None or now - checked_at > Activity.POWER_CHECK_INTERVAL:
+            Activity.__power_checked_at, online = now, []
+            for supply in glob.glob(os.path.join(Activity.POWER_SUPPLY_PATH, "*")):
+                try:
+                    with open(os.path.join(supply, "type")) as f:
+                        if f.read().strip() != "Mains":
+                            continue
+                    with open(os.path.join(supply, "online")) as f:
+                        online.append(f.read().strip() == "1")
+                except OSError:
+                    pass
+            Activity.__on_battery = bool(online) and not any(online)
+        return Activity.__on_battery
+
+
+# Drive the polling widgets by one shared timer instead of a timer per widget,
+# the timer ticks on the wall clock boundaries, so the process wakes once per tick,
+# and the widget intervals are rounded to multiples of the tick.
+# The polling starts after the bars have been painted, avoid the CPU spike at startup.
+# The intervals are stretched when the user is idle, the screen is locked or on battery,
+# except the widgets subscribed with adaptive=False (e.g. the clock, a stale time is wrong),
+# and the polling is suspended when the screen is turned off by DPMS.
+class Ticker:
+    INTERVAL = 1  # Seconds.
+    START_DELAY = 2  # Seconds after the first widget is set up.
+    MARGIN = 0.01  # Fire a bit after the boundary, the clock widgets won't show the last second.
+    STRETCH = {Activity.ACTIVE: 1, Activity.IDLE: 4, Activity.LOCKED: 10}
+    ON_BATTERY_STRETCH = 2
+    SUSPEND_CHECK = 5  # Seconds between the activity checks when the screen is off.
+
+    # The widget intervals in ticks, and whether the intervals are stretched.
+    __widgets: dict[widget.TextBox, tuple[int, bool]] = {}
+    __pending: set[widget.TextBox] = set()  # The widgets should be polled at next tick.
+    __timer: asyncio.TimerHandle = None
+    __stretch = 1  # None when the polling is suspended.
+    __classes: dict[tuple[type, bool], type] = {}
+
+    @staticmethod
+    def subscribe(w: widget.TextBox, interval: float, adaptive: bool = True):
+        Ticker.__widgets[w] = (max(1, round(interval / Ticker.INTERVAL)), adaptive)
+        Ticker.__pending.add(w)
+        if not Ticker.__timer:
+            Ticker.__schedule(Ticker.START_DELAY)
+
+    @staticmethod
+    def unsubscribe(w: widget.TextBox):
+        Ticker.__widgets.pop(w, None)
+        Ticker.__pending.discard(w)
+        if not Ticker.__widgets and Ticker.__timer:
+            Ticker.__timer.cancel()
+            Ticker.__timer = None
+            # All widgets are finalized by the config reload or shutdown,
+            # don't leak the connections of this config to the next one.
+            Activity.disconnect()
+            Notification.disconnect()
+
+    def __schedule(delay: float = 0):
+        now = time.time()
+        tick = int((now + delay) // Ticker.INTERVAL) + 1
+        Ticker.__timer = asyncio.get_running_loop().call_later(
+            tick * Ticker.INTERVAL - now + Ticker.MARGIN, Ticker.__tick, tick
+        )
+
+    def __tick(tick: int):
+        state = Activity.state()
+        if state == Activity.OFF:
+            Ticker.__stretch = None
+            Ticker.__schedule(Ticker.SUSPEND_CHECK)
+            return
+        stretch = Ticker.STRETCH[state]
+        if Activity.on_battery():
+            stretch *= Ticker.ON_BATTERY_STRETCH
+        if Ticker.__stretch is None or stretch < Ticker.__stretch:
+            # The user comes back, refresh all widgets at once instead of showing stale values.
+            Ticker.__pending.update(Ticker.__widgets)
+        Ticker.__stretch = stretch
+        for w, (interval, adaptive) in list(Ticker.__widgets.items()):
+            # Poll the new widgets at once, then only on their aligned ticks.
+            if adaptive:
+                interval *= stretch
+            if tick % interval == 0 or w in Ticker.__pending:
+                Ticker.__pending.discard(w)
+                try:
+                    w.tick()
+                except Exception as e:
+                    logger.warn(f"Poll widget {w.name} failed: {e}")
+        Ticker.__schedule()
+
+    # Get the subclass of the polling widget class (e.g. widget.Net) driven by the ticker.
+    # The polls of the used widgets only read procfs/sysfs, so they run in the event loop.
+    @staticmethod
+    def widget(widget_class: type, adaptive: bool = True) -> type:
+        if (widget_class, adaptive) not in Ticker.__classes:
+
+            class Ticked(widget_class):
+                def timer_setup(self):
+                    Ticker.subscribe(self, self.update_interval, adaptive)
+
+                def tick(self):
+                    if (text := self.poll()) is not None:
+                        self.update(text)
+
+                # Skip the redraw when the text isn't changed.
+                def update(self, text: str):
+                    if text != self.text:
+                        widget_class.update(self, text)
+
+                def finalize(self):
+                    Ticker.unsubscribe(self)
+                    widget_class.finalize(self)
+
+            # Qtile names the widget by its class name.
+            Ticked.__name__ = Ticked.__qualname__ = widget_class.__name__
+            Ticker.__classes[widget_class, adaptive] = Ticked
+        return Ticker.__classes[widget_class, adaptive]
+
+
+# Network throughput of all interfaces, shared by the network widgets of all screens.
+# The /proc/net/dev is read once per tick by the kept file descriptor,
+# the rates are smoothed by exponential moving average.
+class NetStats:
+    PATH = "/proc/net/dev"
+    INTERVAL = 1  # Seconds, stretched by the Ticker.
+    SMOOTHING = 0.5  # The weight of the latest rate.
+    TOTAL = "all"  # The key of the total rate of all interfaces (except loopback).
+    UNITS = ["B", "kB", "MB", "GB", "TB"]
+    name = "net_stats"  # The name in the Ticker logs.
+
+    class Rate(NamedTuple):
+        down: float  # Bytes per second.
+        up: float
+
+    __listeners: list[Callable[[dict[str, Rate]], None]] = []
+    __fd: int = None
+    __counters: dict[str, tuple[int, int]] = {}
+    __rates: dict[str, Rate] = {}
+    __time: float = None
+
+    # Parse the received and transmitted bytes of each interface.
+    @staticmethod
+    def parse(data: bytes) -> dict[str, tuple[int, int]]:
+        counters = {}
+        for line in data.splitlines()[2:]:  # Skip the two header lines.
+            name, _, fields = line.partition(b":")
+            fields = fields.split()
+            counters[name.strip().decode()] = (int(fields[0]), int(fields[8]))
+        return counters
+
+    def __read() -> bytes:
+        if NetStats.__fd is None:
+            NetStats.__fd = os.open(NetStats.PATH, os.O_RDONLY | os.O_CLOEXEC)
+        chunks, offset = [], 0
+        while chunk := os.pread(NetStats.__fd, 65536, offset):
+            chunks.append(chunk)
+            offset += len(chunk)
+        return b"".join(chunks)
+
+    # Read the counters and update the rates, called by the Ticker.
+    @staticmethod
+    def tick():
+        now, counters = time.monotonic(), NetStats.parse(NetStats.__read())
+        interfaces = [v for name, v in counters.items() if name != "lo"]
+        counters[NetStats.TOTAL] = (
+            sum(received for received, _ in interfaces),
+            sum(transmitted for _, transmitted in interfaces),
+        )
+        if NetStats.__time is not None:
+            elapsed, weight = now - NetStats.__time, NetStats.SMOOTHING
+            rates = {}
+            for name, (received, transmitted) in counters.items():
+                last_received, last_transmitted = NetStats.__counters.get(
+                    name, (received, transmitted)
+                )
+                # The counters are reset when the interface is recreated.
+                down = max(received - last_received, 0) / elapsed
+                up = max(transmitted - last_transmitted, 0) / elapsed
+                if last := NetStats.__rates.get(name):
+                    down = weight * down + (1 - weight) * last.down
+                    up = weight * up + (1 - weight) * last.up
+                rates[name] = NetStats.Rate(down, up)
+            NetStats.__rates = rates
+            for listener in NetStats.__listeners:
+                listener(rates)
+        NetStats.__counters, NetStats.__time = counters, now
+
+    @staticmethod
+    def subscribe(listener: Callable[[dict[str, Rate]], None]):
+        if listener not in NetStats.__listeners:
+            NetStats.__listeners.append(listener)
+
+    @staticmethod
+    def unsubscribe(listener: Callable[[dict[str, Rate]], None]):
+        NetStats.__listeners.remove(listener)
+        if not NetStats.__listeners:
+            # No one cares the rates, stop reading.
+            Ticker.unsubscribe(NetStats)
+            NetStats.__time = None  # The counters will be outdated.
+            if NetStats.__fd is not None:
+                os.close(NetStats.__fd)
+                NetStats.__fd = None
+
+    # Start reading by the Ticker, must be called in Qtile event loop.
+    @staticmethod
+    def watch():
+        if NetStats.__time is None:
+            Ticker.subscribe(NetStats, NetStats.INTERVAL)
+
+    # Format the bytes per second, same as the Qtile Net widget, e.g. (1.25, "MB").
+    @staticmethod
+    def format_rate(rate: float) -> tuple[float, str]:
+        power = 0
+        while rate >= 1000 and power < len(NetStats.UNITS) - 1:
+            rate, power = rate / 1000, power + 1
+        return rate, NetStats.UNITS[power]
+
+    # Network widget, the format accepts the same fields as the Qtile Net widget:
+    # down, down_suffix, up, up_suffix, interface.
+    class Widget(widget.TextBox):
+        def __init__(self, format: str, interface: str = None, **config):
+            widget.TextBox.__init__(self, "🌐 ...", **config)
+            self.format, self.interface = format, interface or NetStats.TOTAL
+
+        def _configure(self, qtile, bar):
+            widget.TextBox._configure(self, qtile, bar)
+            NetStats.subscribe(self.show)
+
+        def timer_setup(self):
+            NetStats.watch()  # The timer_setup() is called in Qtile event loop.
+
+        def show(self, rates: dict):
+            if rate := rates.get(self.interface):
+                down, down_suffix = NetStats.format_rate(rate.down)
+                up, up_suffix = NetStats.format_rate(rate.up)
+                text = self.format.format(
+                    down=down,
+                    down_suffix=down_suffix,
+                    up=up,
+                    up_suffix=up_suffix,
+                    interface=self.interface,
+                )
+                if text != self.text:  # Skip the redraw when the text isn't changed.
+                    self.update(text)
+
+        def finalize(self):
+            NetStats.unsubscribe(self.show)
+            widget.TextBox.finalize(self)
+
+
+# The window tabs of the groups, shared by the WindowTabs and WindowCount widgets of all screens.
+# The Qtile widgets rebuild the text on every hook, and WindowTabs redraws the whole bar,
+# the labels here are cached per window and recomputed only when the window changed,
+# the title changes (e.g. progress output of terminals) are shown at most once per TITLE_DELAY,
+# and the widgets skip the redraw when the rendered text isn't changed.
+class WindowState:
+    TITLE_DELAY = 0.5  # Seconds.
+
+    __labels: dict[Window, tuple[tuple, str]] = {}  # The window state and its label.
+    __listeners: list[Callable[[set], None]] = []
+    __dirty: set = set()  # The groups have title changes not shown yet.
+    __timer: asyncio.TimerHandle = None
+    __handle: asyncio.Handle = None
+    __notified_at = 0.0
+
+    # The label of the window tab, same as the Qtile WindowTabs widget.
+    @staticmethod
+    def label(w: Window) -> str:
+        state = (w.name, w.minimized, w.maximized, w.floating)
+        cached = WindowState.__labels.get(w)
+        if not cached or cached[0] != state:
+            if w.minimized:
+                prefix = "_ "
+            elif w.maximized:
+                prefix = "[] "
+            else:
+                prefix = "V " if w.floating else ""
+            label = pangocffi.markup_escape_text(f"{prefix}{w.name or ' '}")
+            cached = WindowState.__labels[w] = (state, label)
+        return cached[1]
+
+    @staticmethod
+    def tabs(group) -> list[str]:
+        return [WindowState.label(w) for w in group.windows]
+
+    @staticmethod
+    def subscribe(listener: Callable[[set], None]):
+        if listener not in WindowState.__listeners:
+            WindowState.__listeners.append(listener)
+
+    @staticmethod
+    def unsubscribe(listener: Callable[[set], None]):
+        WindowState.__listeners.remove(listener)
+
+    # The windows, the focus or the screen groups changed,
+    # notify all groups once after the current event handled (Qtile fires several hooks per event).
+    @staticmethod
+    def changed(*_):
+        if not WindowState.__handle and (loop := WindowState.__loop()):
+            WindowState.__handle = loop.call_soon(WindowState.__notify, None)
+
+    @staticmethod
+    def title_changed(w: Window):
+        if not w.group:
+            return
+        WindowState.__dirty.add(w.group)
+        if WindowState.__timer or WindowState.__handle:
+            return  # Shown by the scheduled notification.
+        if loop := WindowState.__loop():
+            elapsed = time.monotonic() - WindowState.__notified_at
+            WindowState.__timer = loop.call_later(
+                max(WindowState.TITLE_DELAY - elapsed, 0),
+                WindowState.__notify,
+                WindowState.__dirty,
+            )
+
+    # The hooks may be fired before Qtile event loop started (e.g. when managing the existing windows),
+    # the widgets render the whole state when they are set up.
+    def __loop() -> asyncio.AbstractEventLoop:
+        try:
+            return asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+    def __notify(groups: set):
+        for handle in [WindowState.__timer, WindowState.__handle]:
+            if handle:
+                handle.cancel()
+        WindowState.__timer = WindowState.__handle = None
+        WindowState.__dirty, WindowState.__notified_at = set(), time.monotonic()
+        for listener in WindowState.__listeners:
+            listener(groups)
+
+    @staticmethod
+    def forget(w: Window):
+        WindowState.__labels.pop(w, None)
+        WindowState.changed()
+
+    # Window tabs widget, the config is same as the Qtile WindowTabs widget.
+    class Tabs(widget.WindowTabs):
+        def setup_hooks(self):
+            WindowState.subscribe(self.refresh)
+            self.add_callbacks({"Button1": self.bar.screen.group.cmd_next_window})
+            self.refresh()
+
+        # Refresh when the group shown by the screen is in the changed groups (None for all).
+        def refresh(self, groups: set = None):
+            group = self.bar.screen.group
+            if not group or groups is not None and group not in groups:
+                return
+            tabs = WindowState.tabs(group)
+            if group.current_window in group.windows:
+                index = group.windows.index(group.current_window)
+                tabs[index] = tabs[index].join(self.selected)
+            text = self.separator.join(tabs)
+            if callable(self.parse_text):
+                text = self.parse_text(text)
+            if text != self.text:
+                self.text = text
+                self.draw()  # The width is stretched, no need to redraw the whole bar.
+
+        # Called by WindowTabs.finalize(), the hooks of WindowTabs have never been subscribed.
+        def remove_hooks(self):
+            WindowState.unsubscribe(self.refresh)
+
+    # Window count widget, the title changes are ignored.
+    class Count(widget.WindowCount):
+        def _setup_hooks(self):
+            WindowState.subscribe(self.refresh)
+
+        # Only the window and group changes are notified with all groups.
+        def refresh(self, groups: set = None):
+            if groups is None:
+                self._wincount()  # Skip the redraw when the text isn't changed.
+
+        # Skip WindowCount.finalize(), the hooks of WindowCount have never been subscribed.
+        def finalize(self):
+            WindowState.unsubscribe(self.refresh)
+            super(widget.WindowCount, self).finalize()
+
+
+# The window state hooks, named by the hooks in the latency statistics and the trace.
+@hook.subscribe.focus_change
+@Latency.measure
+def window_state_focus_change():
+    WindowState.changed()
+
+
+@hook.subscribe.float_change  # Also fired by minimizing.
+@Latency.measure
+def window_state_float_change():
+    WindowState.changed()
+
+
+@hook.subscribe.client_managed
+@Latency.measure
+def window_state_client_managed(c: Window):
+    WindowState.changed()
+
+
+@hook.subscribe.group_window_add
+@Latency.measure
+def window_state_group_window_add(group, w: Window):
+    WindowState.changed()
+
+
+@hook.subscribe.setgroup
+@Latency.measure
+def window_state_setgroup():
+    WindowState.changed()
+
+
+@hook.subscribe.current_screen_change
+@Latency.measure
+def window_state_current_screen_change():
+    WindowState.changed()
+
+
+@hook.subscribe.client_killed
+@Latency.measure
+def window_state_client_killed(c: Window):
+    WindowState.forget(c)
+
+
+@hook.subscribe.client_name_updated
+@Latency.measure
+def window_state_client_name_updated(c: Window):
+    WindowState.title_changed(c)
+
+
+# Build the screen with the scaling factor of the screen.
+def build_screen(index: int) -> Screen:
+    size = lambda origin_size: scaling_size(origin_size, index)
+    margin, font = size(5), dict(fontsize=size(12), padding=size(2))
+    widgets = [
+        widget.CurrentLayoutIcon(scale=0.8),
+        widget.GroupBox(**font),
+        widget.Prompt(**font),
+        WindowState.Count(text_format="⎛{num}⎠", **font),
+        WindowState.Tabs(**font),
+        NetStats.Widget(format="🌐 {down:.2f}{down_suffix}", **font),
+        Ticker.widget(widget.Battery)(
+            format="🔋 {percent:2.0%}({char})",
+            update_interval=10,
+            show_short_text=False,  # Make battery plugin show full format text in Full/Empty status.
+            **font,
+        ),
+        VolumeControl.Widget(**font),
+        Ticker.widget(widget.Clock, adaptive=False)(
+            format="%b/%d/%Y %a %H:%M",
+            update_interval=60,  # The format has no seconds, tick on the minute boundaries.
+            foreground=Color.CLOCK,
+            **font,
+        ),
+    ]
+    if index == 0:
+        # Only one systray is allowed, put it on the primary screen.
+        widgets.insert(-1, widget.Systray(icon_size=size(20), paddling=size(5)))
     # By default, Qtile layout window margin will cause the gap between two window double size,
     # should use Screen gap to fill the remaining width.
     # Screen gap + Window margin == 2 * Window margin
-    Screen(
+    return Screen(
         top=bar.Bar(
-            [
-                widget.CurrentLayoutIcon(scale=0.8),
-                widget.GroupBox(),
-                widget.Prompt(),
-                widget.WindowCount(text_format="⎛{num}⎠"),
-                widget.WindowTabs(),
-                widget.Net(format="🌐 {down:.2f}{down_suffix}"),
-                widget.Battery(
-                    format="🔋 {percent:2.0%}({char})",
-                    update_interval=10,
-                    show_short_text=False,  # Make battery plugin show full format text in Full/Empty status.
-                ),
-                widget.GenPollText(
-                    func=VolumeControl.get_volume_text, update_interval=1
-                ),
-                widget.Systray(icon_size=icon_size, paddling=icon_padding),
-                widget.Clock(format="%b/%d/%Y %a %H:%M", foreground=Color.CLOCK),
-            ],
-            bar_height,
+            widgets,
+            size(25),
             opacity=0.7,
             # [N E S W]
             margin=[0, 0, margin, 0],
@@ -586,7 +2158,10 @@ screens = [
         left=bar.Gap(margin),
         right=bar.Gap(margin),
     )
-]
+
+
+screens = [build_screen(i) for i in range(len(screen_dpis))]
+Session.profile("screens")
 layouts = [
     build_layout(
         margin=margin,
@@ -597,7 +2172,52 @@ layouts = [
     )
     for build_layout in [layout.Columns, layout.MonadThreeCol, layout.Zoomy]
 ]
-floating_layout = layout.Floating(
+
+
+# Floating layout with the compiled float rules, Qtile checks the rules for every new window.
+# The simple rules (one wm_class or wm_type string) are indexed,
+# the results of the rules only depend on the window class and type are memoized,
+# other rules (e.g. title, func) are still checked one by one.
+class FloatingLayout(layout.Floating):
+    INDEXED = {"wm_class", "wm_type"}
+    STATIC = {"wm_class", "wm_instance_class", "wm_type"}
+    CACHE_SIZE = 1024
+
+    def __init__(self, float_rules: list[Match], **config):
+        layout.Floating.__init__(self, float_rules=float_rules, **config)
+        self.__index: dict[str, set[str]] = {name: set() for name in self.INDEXED}
+        self.__static_rules, self.__dynamic_rules = [], []
+        # Shared by the cloned layouts of all groups.
+        self.__cache: dict[tuple, bool] = {}
+        for rule in float_rules:
+            # The properties of Qtile Match, check the unknown rule by Window.match().
+            properties: dict = getattr(rule, "_rules", None) or {"unknown": None}
+            name, value = next(iter(properties.items()))
+            if len(properties) == 1 and name in self.INDEXED and isinstance(value, str):
+                self.__index[name].add(value)
+            elif properties.keys() <= self.STATIC:
+                self.__static_rules.append(rule)
+            else:
+                self.__dynamic_rules.append(rule)
+
+    # Called by Qtile when the window is added to group.
+    def match(self, win: Window) -> bool:
+        key = (tuple(win.get_wm_class() or ()), win.get_wm_type())
+        static = self.__cache.get(key)
+        if static is None:
+            wm_classes, wm_type = key
+            static = (
+                any(c in self.__index["wm_class"] for c in wm_classes)
+                or wm_type in self.__index["wm_type"]
+                or any(win.match(rule) for rule in self.__static_rules)
+            )
+            if len(self.__cache) >= self.CACHE_SIZE:
+                self.__cache.clear()
+            self.__cache[key] = static
+        return static or any(win.match(rule) for rule in self.__dynamic_rules)
+
+
+floating_layout = FloatingLayout(
     border_width=border_width,
     border_focus=Color.Border.FLOATING_FOCUS,
     border_normal=Color.Border.NORMAL,
@@ -608,19 +2228,104 @@ floating_layout = layout.Floating(
         Application.Terminal.MATCH_RULE,
     ],
 )
+Session.profile("layouts")
+
+
+# Qtile calls the drag commands with the new geometry on every pointer motion event,
+# the high polling rate mice send far more events than the screen can show.
+# Coalesce the events to the frame rate, only the latest geometry in a frame is applied,
+# and the pending geometry is committed at once when the button is released.
+class DragThrottle:
+    FRAME_RATE = 60  # Frames per second, 0 applies every motion event.
+
+    __pending: tuple[Window, str, int, int] = None  # The window, command and geometry.
+    __timer: asyncio.TimerHandle = None
+    __applied_at = 0.0
+    __received = __applied = 0
+
+    @staticmethod
+    def motion(qtile: Qtile, command: str, x: int, y: int):
+        DragThrottle.__received += 1
+        if not (w := qtile.current_window):
+            return
+        if DragThrottle.__pending and DragThrottle.__pending[0] is not w:
+            DragThrottle.commit()  # The previous drag isn't finished by release.
+        DragThrottle.__pending = (w, command, x, y)
+        if DragThrottle.__timer:
+            return  # Applied by the frame timer.
+        frame = 1 / DragThrottle.FRAME_RATE if DragThrottle.FRAME_RATE else 0
+        wait = DragThrottle.__applied_at + frame - time.monotonic()
+        if wait <= 0:
+            DragThrottle.commit()  # The first event in a frame is applied without delay.
+        else:
+            DragThrottle.__timer = asyncio.get_running_loop().call_later(
+                wait, DragThrottle.__apply_frame, qtile
+            )
+
+    def __apply_frame(qtile: Qtile):
+        DragThrottle.__timer = None
+        DragThrottle.commit()
+        qtile.core.flush()  # Out of the X event handling, send the request now.
+
+    # Apply the pending geometry.
+    @staticmethod
+    def commit():
+        if DragThrottle.__timer:
+            DragThrottle.__timer.cancel()
+            DragThrottle.__timer = None
+        if not (pending := DragThrottle.__pending):
+            return
+        DragThrottle.__pending = None
+        w, command, x, y = pending
+        if w.group:  # The window may be killed during the drag.
+            getattr(w, command)(x, y)
+            DragThrottle.__applied += 1
+            DragThrottle.__applied_at = time.monotonic()
+
+    @staticmethod
+    def stats() -> dict[str, int]:
+        return {"received": DragThrottle.__received, "applied": DragThrottle.__applied}
+
+    @staticmethod
+    def report():
+        logger.warn(f"Drag motion events: {DragThrottle.stats()}")
+
+    # Commit the drag before Qtile ends it, the original method is kept over config reloads.
+    __release = getattr(
+        Qtile.process_button_release, "__wrapped__", Qtile.process_button_release
+    )
+
+    @functools.wraps(__release)
+    def __process_button_release(qtile: Qtile, *args, **kwargs):
+        DragThrottle.commit()
+        return DragThrottle.__release(qtile, *args, **kwargs)
+
+    Qtile.process_button_release = __process_button_release
+    Qtile.cmd_drag_stats = lambda _: DragThrottle.stats()
+
+
+hook.subscribe.shutdown(DragThrottle.report)
+
+
+@lazy.function
+@Latency.measure
+def drag_window(qtile: Qtile, command: str, x: int, y: int):
+    DragThrottle.motion(qtile, command, x, y)
+
 
 # Drag floating layouts.
 mouse = [
     Drag(
         [mod],
         "Button1",
-        lazy.window.set_position(),  # Use set_position_floating() will make any window floating.
+        # Use cmd_set_position_floating() will make any window floating.
+        drag_window("cmd_set_position"),
         start=lazy.window.get_position(),
     ),
     Drag(
         [mod, "control"],
         "Button1",
-        lazy.window.set_size_floating(),
+        drag_window("cmd_set_size_floating"),
         start=lazy.window.get_size(),
     ),
     Click([mod], "Button3", lazy.window.bring_to_front()),
@@ -628,10 +2333,38 @@ mouse = [
 
 # Hooks.
 @hook.subscribe.client_focus
+@Latency.measure
 def client_focus(c: Window):
     if c.floating:
         c.cmd_bring_to_front()  # Bring the floating focus window to front.
     else:
-        terminals = [w for w in c.group.windows if w.floating and w.is_terminal()]
-        terminals.reverse()  # Reverse terminal windows' order, then move to terminal group.
-        [w.togroup(Application.Terminal.GROUP_NAME) for w in terminals]
+        terminals = TerminalIndex.floating_terminals(c.qtile, c.group.name)
+        if terminals:  # Skip all work when there is no floating terminal.
+            # Reverse terminal windows' order, then move to terminal group.
+            move_windows(
+                c.qtile, terminals, Application.Terminal.GROUP_NAME, reverse=True
+            )
+
+
+@hook.subscribe.client_new
+@Latency.measure
+def client_new(c: Window):
+    Application.Terminal.hide_warm(c)
+
+
+@hook.subscribe.group_window_add
+@Latency.measure
+def group_window_add(group, w: Window):
+    TerminalIndex.add(group.name, w)
+    MinimizedStack.move(group.name, w)
+
+
+@hook.subscribe.client_killed
+@Latency.measure
+def client_killed(c: Window):
+    TerminalIndex.remove(c)
+    MinimizedStack.remove(c)
+
+
+Session.profile("hooks")
+Session.loaded()